@@ -1,34 +1,65 @@
-from components.summarizer import SummaryManager
+from components.executor import embedding_pool, scoring_pool, llm_pool
+from components.embedding_cache import embedding_cache
+from components.batcher import embedding_batcher
+from components.responses import FastJSONResponse
+from components.summarizer import create_summary_manager
+from components.reloader import ArchiveReloader, ArchiveState
+from components.rankings import RankingCache
+from components.registry import model_registry
 from components.keywords import Keywords
 from components.matrix import Matrix
 from components.logger import logger
-from components.jaeger import Jaeger
-from components.llm import GptLLM
+from components.llm import create_llm, response_cache
 from components.cvs import CVS
 
-from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from functools import partial
 from typing import Union
+import threading
 import warnings
 import uvicorn
 import json
+import time
 import os
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+
+@app.middleware("http")
+async def add_timing(request: Request, call_next):
+    start_time = time.perf_counter()
+    response = await call_next(request)
+    duration = (time.perf_counter() - start_time) * 1000
+    response.headers.append('Server-Timing', f"total;dur={duration:.1f}")
+    logger.debug(f"{request.url.path} served in {duration:.1f}ms ({response.headers.get('Server-Timing')})")
+    return response
 
 
 warnings.filterwarnings("ignore")
 
 
-cvs = CVS()
-cvs.load_pkl()
+def load_archive() -> 'CVS':
+    # the workers started by serve.py open the columnar archive already written by its loader, they never write it
+    new_cvs = CVS()
+    new_cvs.load(build_columnar=os.getenv('ARCHIVE_BUILD_COLUMNAR', '1') == '1')
+    new_cvs.get_fragment_matrix()
+    new_cvs.get_text_index()
+    return new_cvs
+
+
+archive_state = ArchiveState(cvs=load_archive())
 
-jaeger = Jaeger(cvs=cvs)
+model_registry.warm_up()
+logger.info(f"Embedding models ready: {model_registry.get_stats()}")
 
-llm = GptLLM(api_key=os.getenv('API_KEY'))
-llm_summary = GptLLM(api_key=os.getenv('API_KEY'), model='gpt-4o-mini')
+llm = create_llm()
+llm_summary = create_llm(model='gpt-4o-mini')
 
-summary_manager = SummaryManager(file_name='llm_resources_summary.json')
+summary_manager = create_summary_manager()
 
 
 # matrix_cq = Matrix('source/matrix_ontology/C&Q_Matrix.xlsx', exe_scale=False)
@@ -74,12 +105,107 @@ matrix_md = Matrix.load('md_matrix')
 matrix_pv = Matrix.load('pv_matrix')
 matrix_eng = Matrix.load('eng_matrix')
 
+matrices = {'PV': matrix_pv, 'C&Q': matrix_cq, 'CSV': matrix_csv, 'LES': matrix_les, 'GCP': matrix_gcp,
+            'RA': matrix_ra, 'COMP': matrix_comp, 'DG': matrix_dg, 'MD': matrix_md, 'ENG': matrix_eng}
+
+coe_rankings = RankingCache()
+
+
+def warm_rankings(state: 'ArchiveState') -> None:
+    coe_rankings.invalidate(identity=state.identity)
+    threading.Thread(target=coe_rankings.warm, daemon=True,
+                     kwargs={'identity': state.identity,
+                             'computes': {coe_name: partial(search, state, keywords=matrix_obj.get_col(),
+                                                            runtype='semantic')
+                                          for coe_name, matrix_obj in matrices.items()}}).start()
+
+
+def swap_archive(new_cvs: 'CVS') -> None:
+    """
+    Replace the archive served by the handlers with a new one already loaded and indexed, then drop the caches
+    computed on the old archive. The archive, its Jaeger and its identity are swapped together as one state.
+
+    :param new_cvs: the CVS object of the new archive
+
+    :return: nothing
+    """
+    global archive_state
+    archive_state = ArchiveState(cvs=new_cvs)
+    warm_rankings(archive_state)
+
+
+archive_reloader = ArchiveReloader(cvs=archive_state.cvs, on_swap=swap_archive,
+                                   interval=float(os.getenv('ARCHIVE_RELOAD_INTERVAL', 0)))
+
+
+@app.on_event("startup")
+def startup() -> None:
+    warm_rankings(archive_state)
+    archive_reloader.start()
+
+
+@app.on_event("shutdown")
+def shutdown() -> None:
+    archive_reloader.stop()
+    embedding_cache.save()
+    response_cache.save()
+    logger.info(f"Embedding cache statistics: {embedding_cache.get_stats()}")
+    for pool in (embedding_pool, scoring_pool, llm_pool):
+        pool.shutdown()
+
+
+@app.get("/stats/")
+def stats() -> dict:
+    """
+    End Point to monitor the queue depth of the worker pools, the embedding and LLM caches, the embedding models and
+    the archive served
+
+    :return: dictionary with the statistics of each pool, of the caches, of the models and of the archive
+    """
+    return {'pools': {pool.name: pool.get_stats() for pool in (embedding_pool, scoring_pool, llm_pool)},
+            'embedding_batcher': embedding_batcher.get_stats(),
+            'embedding_cache': embedding_cache.get_stats(),
+            'llm_cache': response_cache.get_stats(),
+            'models': model_registry.get_stats(),
+            'archive': archive_reloader.get_status()}
+
+
+@app.post("/admin/reload/")
+def reload_archive(force: bool = False) -> dict:
+    """
+    End Point to load the most recent CV archive in the background and swap it in when it is ready, the current
+    archive keeps serving the searches until the swap
+
+    :param force: boolean to reload the archive even when it is the one already served
+
+    :return: dictionary with the status of the reload and the archive currently served
+    """
+    if not force and not archive_reloader.is_outdated():
+        return {'status': 'up to date', **archive_reloader.get_status()}
+    return archive_reloader.trigger(force=force)
+
 
 @app.get("/keywords/")
-def keywords_list(skills: dict) -> dict:
-    keywords = Keywords(skills['list_skills'], [1]*len(skills['list_skills']))
+async def keywords_list(skills: dict) -> dict:
+    """
+    End Point to search in the 1_Semantic page the resources based on the list of skills
+
+    :param skills: dictionary with the list of skills, the optional 'business_line' (or list of business lines) to
+        search only the CVs of its shard, the optional number 'k' of best resources and minimum 'threshold' of the
+        score to return, the optional list of Person 'fields' to return and the optional flag 'include_body' to return
+        the bodies of the CVs
+
+    :return: dictionary with the resources and the score
+    """
+    state = archive_state
+    keywords = await embedding_pool.run(Keywords, skills['list_skills'], [1]*len(skills['list_skills']),
+                                        encoder=embedding_batcher)
     logger.info(f"Executed Semantic search")
-    return search(keywords=keywords, runtype='semantic')
+    results = await scoring_pool.run(search, state, keywords=keywords, runtype='semantic',
+                                     bl=skills.get('business_line'), k=skills.get('k'),
+                                     threshold=skills.get('threshold'), fields=skills.get('fields'),
+                                     include_body=skills.get('include_body', False))
+    return await scoring_pool.run(FastJSONResponse, results)
 
 
 @app.get("/get_ontology/")
@@ -129,50 +255,32 @@ def ontology(CoE_matrix: dict) -> dict:
 
 
 @app.get("/coe/")
-def coe(CoE: dict) -> dict:
+async def coe(CoE: dict) -> dict:
     """
-    End Point to search in the 3_Ontology page the resources based on the CoE selected
+    End Point to search in the 3_Ontology page the resources based on the CoE selected. The ranking of each CoE
+    depends only on the archive, so it is computed once per archive and then served from the ranking cache
 
-    :param CoE: the name of the CoE selected which refers to the list of skills to use
+    :param CoE: the name of the CoE selected which refers to the list of skills to use, with the optional list of
+        Person 'fields' to return and the optional flag 'include_body' to return the bodies of the CVs
 
     :return: dictionary containing the resources and the score
     """
     logger.info(f"Executed Ontologic search for {CoE['coe_name']}")
-    match CoE['coe_name']:
-        case '**PV**':
-            keywords = matrix_pv.get_col()
-            return search(keywords=keywords, runtype='semantic')
-        case '**C&Q**':
-            keywords = matrix_cq.get_col()
-            return search(keywords=keywords, runtype='semantic')
-        case '**CSV**':
-            keywords = matrix_csv.get_col()
-            return search(keywords=keywords, runtype='semantic')
-        case '**LES**':
-            keywords = matrix_les.get_col()
-            return search(keywords=keywords, runtype='semantic')
-        case '**GCP**':
-            keywords = matrix_gcp.get_col()
-            return search(keywords=keywords, runtype='semantic')
-        case '**RA**':
-            keywords = matrix_ra.get_col()
-            return search(keywords=keywords, runtype='semantic')
-        case '**COMP**':
-            keywords = matrix_comp.get_col()
-            return search(keywords=keywords, runtype='semantic')
-        case '**DG**':
-            keywords = matrix_dg.get_col()
-            return search(keywords=keywords, runtype='semantic')
-        case '**MD**':
-            keywords = matrix_md.get_col()
-            return search(keywords=keywords, runtype='semantic')
-        case '**ENG**':
-            keywords = matrix_eng.get_col()
-            return search(keywords=keywords, runtype='semantic')
+    coe_name = CoE['coe_name'].strip('*')
+    if coe_name in matrices:
+        state = archive_state
+        ranking = coe_rankings.peek(name=coe_name, identity=state.identity)
+        if ranking is None:
+            ranking = await scoring_pool.run(coe_rankings.get, name=coe_name, identity=state.identity,
+                                             compute=partial(search, state, keywords=matrices[coe_name].get_col(),
+                                                             runtype='semantic'))
+        results = await scoring_pool.run(state.jaeger.project, ranking, fields=CoE.get('fields'),
+                                         include_body=CoE.get('include_body', False))
+        return await scoring_pool.run(FastJSONResponse, results)
 
 
 @app.get("/matrix/")
-def matrix(skill: dict) -> dict[str, dict]:
+async def matrix(skill: dict) -> dict[str, dict]:
     """
     End Point to search in the 4_Matrix page the resources based on the list of skills selected and the
     CoE representing the matrix where to sort the resources
@@ -181,69 +289,133 @@ def matrix(skill: dict) -> dict[str, dict]:
 
     :return: dictionary with the resources and the score for the specific Skills
     """
-    return search(keywords=skill['list_skills'][0], runtype='matrix', matrix_type=skill['list_skills'][1])
+    state = archive_state
+    keywords = await embedding_pool.run(to_keywords, skill['list_skills'][0], encoder=embedding_batcher)
+    results = await scoring_pool.run(search, state, keywords=keywords, runtype='matrix',
+                                     matrix_type=skill['list_skills'][1])
+    return await scoring_pool.run(FastJSONResponse, results)
+
+
+@app.get("/resolve/")
+async def resolve(skill: dict) -> dict[str, list]:
+    """
+    End Point to find the Matrix columns most similar to each skill, in one CoE matrix or in all of them
+
+    :param skill: dictionary containing the list of skills, the optional CoE name and the optional number of
+        candidates 'top_k'
+
+    :return: dictionary with the list of (CoE, column, similarity) candidates for each skill
+    """
+    coe_name = skill.get('coe_name', 'ALL')
+    if coe_name != 'ALL' and coe_name not in matrices:
+        raise HTTPException(status_code=404, detail=f"Unknown CoE matrix {coe_name}, expected one of {list(matrices)}")
+    keywords = await embedding_pool.run(Keywords, skill['list_skills'], [1]*len(skill['list_skills']),
+                                        encoder=embedding_batcher)
+    selected = matrices if coe_name == 'ALL' else {coe_name: matrices[coe_name]}
+    candidates = await scoring_pool.run(Matrix.resolve_many, matrices=selected, embeddings=keywords.get_embedding(),
+                                        top_k=int(skill.get('top_k', 5)))
+    return {word: [{'coe': coe, 'column': column, 'similarity': score} for coe, column, score in word_candidates]
+            for word, word_candidates in zip(keywords.get_words(), candidates)}
 
 
 @app.get('/logic/')
-def logic(keywords: dict) -> dict:
+async def logic(keywords: dict) -> dict:
     """
     End Point to search in the 2_Logic page the resources based on the list of skills inserted by the user
 
-    :param keywords: list of skills contained in a dictionary
+    :param keywords: list of skills contained in a dictionary, with the optional 'business_line' (or list of
+        business lines) to search only its CVs, the optional flag 'frequency' to score the
+        resources by the occurrences of the skills instead of their presence, the optional number 'k' of best
+        resources and minimum 'threshold' of the score to return, the optional list of Person 'fields' to return and
+        the optional flag 'include_body' to return the bodies of the CVs
 
     :return: dictionary with the resources and the score addressed to the specific skills
     """
-    return search(keywords=keywords['list_skills'], runtype='logic')
+    state = archive_state
+    list_skills = await embedding_pool.run(to_keywords, keywords['list_skills'], encoder=embedding_batcher)
+    results = await scoring_pool.run(search, state, keywords=list_skills, runtype='logic',
+                                     bl=keywords.get('business_line'), frequency=keywords.get('frequency', False),
+                                     k=keywords.get('k'), threshold=keywords.get('threshold'),
+                                     fields=keywords.get('fields'), include_body=keywords.get('include_body', False))
+    return await scoring_pool.run(FastJSONResponse, results)
 
 
-def search(keywords: Union['Keywords', dict, list[str]], runtype: str, matrix_type: str = None) -> dict:
+def to_keywords(keywords: Union['Keywords', dict, list[str]],
+                encoder: Union['EmbeddingCache', 'EmbeddingBatcher'] = embedding_cache) -> 'Keywords':
     if isinstance(keywords, dict):
         key_names, weights = keywords.keys(), keywords.values()
-        keywords = Keywords(list(key_names), list(weights))
+        keywords = Keywords(list(key_names), list(weights), encoder=encoder)
     if isinstance(keywords, list):
-        keywords = Keywords(keywords, [1]*len(keywords))
+        keywords = Keywords(keywords, [1]*len(keywords), encoder=encoder)
+    return keywords
+
+
+def search(state: 'ArchiveState', keywords: Union['Keywords', dict, list[str]], runtype: str,
+           matrix_type: str = None, bl: str | list[str] = None, frequency: bool = False, k: int = None,
+           threshold: float = None, fields: list[str] = None, include_body: bool = False) -> dict:
+    keywords = to_keywords(keywords)
     match runtype:
         case 'semantic':
-            return jaeger.export_results(keywords=keywords, show=True, runtype='semantic')
+            return state.jaeger.export_results(keywords=keywords, show=True, runtype='semantic', bl=bl, k=k,
+                                               threshold=threshold, fields=fields, include_body=include_body)
         case 'logic':
             logger.info(f"Executed Logic search")
             print(keywords)
-            return jaeger.export_results(keywords=keywords, show=True, runtype='logic')
+            return state.jaeger.export_results(keywords=keywords, show=True, runtype='logic', bl=bl,
+                                               frequency=frequency, k=k, threshold=threshold, fields=fields,
+                                               include_body=include_body)
         case 'matrix':
             logger.info(f"Executed Matrix search for {matrix_type}")
-            match matrix_type:
-                case 'C&Q':
-                    return jaeger.export_results(keywords=keywords, show=True,
-                                                 runtype='matrix', matrix_obj=matrix_cq)
-                case 'PV':
-                    return jaeger.export_results(keywords=keywords, show=True,
-                                                 runtype='matrix', matrix_obj=matrix_pv)
-                case 'CSV':
-                    return jaeger.export_results(keywords=keywords, show=True,
-                                                 runtype='matrix', matrix_obj=matrix_csv)
-                case 'GCP':
-                    return jaeger.export_results(keywords=keywords, show=True,
-                                                 runtype='matrix', matrix_obj=matrix_gcp)
-                case 'DG':
-                    return jaeger.export_results(keywords=keywords, show=True,
-                                                 runtype='matrix', matrix_obj=matrix_dg)
-                case 'COMP':
-                    return jaeger.export_results(keywords=keywords, show=True,
-                                                 runtype='matrix', matrix_obj=matrix_comp)
-                case 'LES':
-                    return jaeger.export_results(keywords=keywords, show=True,
-                                                 runtype='matrix', matrix_obj=matrix_les)
-                case 'ENG':
-                    return jaeger.export_results(keywords=keywords, show=True,
-                                                 runtype='matrix', matrix_obj=matrix_eng)
-                case 'RA':
-                    return jaeger.export_results(keywords=keywords, show=True,
-                                                 runtype='matrix', matrix_obj=matrix_ra)
+            if matrix_type in matrices:
+                return state.jaeger.export_results(keywords=keywords, show=True,
+                                                   runtype='matrix', matrix_obj=matrices[matrix_type])
+
+
+@app.get('/bodies/')
+def bodies(resources: dict) -> dict[str, str]:
+    """
+    End Point to get on demand the CV bodies, or a snippet of them, of a list of resources, since the search results
+    do not contain the bodies by default
+
+    :param resources: dictionary with the list of resource 'codes', the optional 'length' of the snippets and the
+        optional list of 'keywords' around which the snippets are taken
+
+    :return: dictionary with the body, or the snippet, of each resource found
+    """
+    state = archive_state
+    results = {}
+    for code in resources['codes']:
+        cv = state.cvs.get_cv(code)
+        if cv is None:
+            continue
+        if resources.get('length') is None:
+            results[code] = cv.get_body()
+        else:
+            results[code] = cv.get_snippet(length=int(resources['length']), words=resources.get('keywords'))
+    return FastJSONResponse(results)
+
+
+def find_summary(state: 'ArchiveState', name: str) -> tuple['CVperson', Union[str, None]]:
+    """
+    Find the CV of the resource and the summary stored for its resume, reading the SQLite database
+
+    :param state: the archive state read by the handler
+    :param name: the name of the resource
 
+    :return: the CV object, None when the resource is not found, and its summary, None when the summary has to be
+        produced
+    """
+    cv = state.cvs.get_cv_byname(name)
+    logger.debug(f"'Resource Selected: {cv}'")
+    if cv is None:
+        return None, None
+    if summary_manager.check_infos(cv=cv):
+        return cv, summary_manager.get_summary(resource_key=name, resume_date=cv.get_resume_date())
+    return cv, None
 
 
 @app.get('/names/')
-def code(resource: dict) -> dict[str, str]:
+async def code(resource: dict) -> dict[str, str]:
     """
     End Point to get the Summary of the resource selected by the Name
 
@@ -251,19 +423,78 @@ def code(resource: dict) -> dict[str, str]:
 
     :return: dictionary containing the resource name and the summary by the LLM model
     """
-    logger.debug(f"'Resource Selected: {cvs.get_cv_byname(resource['name'])}'")
-    if summary_manager.check_infos(cv=cvs.get_cv_byname(resource['name'])):
+    cv, summary = await scoring_pool.run(find_summary, archive_state, resource['name'])
+    if cv is None:
+        raise HTTPException(status_code=404, detail=f"Resource {resource['name']} not found")
+    if summary is not None:
         logger.info(f"Summary found for {resource['name']}")
-        return {'answer': summary_manager.get_summary(resource_key=resource['name'])}
-
-    llm_answer, *_ = llm_summary.get_answer(cvs.get_cv_byname(resource['name']))
-    summary_manager.save_summary(cv=cvs.get_cv_byname(resource['name']), summary=llm_answer)
-    logger.info(f"Summary produced for {resource['name']}")
+        return {'answer': summary}
+
+    llm_answer, *_ = await llm_pool.run(llm_summary.get_answer, cv)
+    if not llm_answer or not llm_answer.strip():
+        logger.warning(f"Empty summary produced for {resource['name']}, not saved")
+        raise HTTPException(status_code=502, detail=f"The summary of {resource['name']} is empty, try again")
+    try:
+        await scoring_pool.run(summary_manager.save_summary, cv=cv, summary=llm_answer)
+        logger.info(f"Summary produced for {resource['name']}")
+    except Exception as e:
+        logger.error(f"Summary produced for {resource['name']} but not saved: {e}")
     return {'answer': llm_answer}
 
 
+@app.get('/names/stream/')
+async def code_stream(resource: dict) -> StreamingResponse:
+    """
+    End Point to stream the Summary of the resource selected by the Name as server-sent events, forwarding the
+    pieces of the answer while the LLM model produces them. The summary is saved only when the stream is complete
+    and not empty
+
+    :param resource: the name of the resources selected by the user
+
+    :return: stream of events with data {'token': piece of the summary}
+    """
+    cv, summary = await scoring_pool.run(find_summary, archive_state, resource['name'])
+    if cv is None:
+        raise HTTPException(status_code=404, detail=f"Resource {resource['name']} not found")
+
+    async def events():
+        if summary is not None:
+            logger.info(f"Summary found for {resource['name']}")
+            yield f"data: {json.dumps({'token': summary})}\n\n"
+            return
+        pieces = []
+        stream = llm_summary.get_answer_stream(cv)
+        stream_lock = threading.Lock()
+
+        def next_piece() -> Union[str, None]:
+            with stream_lock:
+                return next(stream, None)
+
+        def close_stream() -> None:
+            with stream_lock:
+                stream.close()
+
+        try:
+            while (piece := await llm_pool.run(next_piece)) is not None:
+                pieces.append(piece)
+                yield f"data: {json.dumps({'token': piece})}\n\n"
+        finally:
+            # when the client disconnects a piece may still be read on the pool, the stream is closed after it
+            threading.Thread(target=close_stream, name='summary-stream-close', daemon=True).start()
+        if ''.join(pieces).strip():
+            try:
+                await scoring_pool.run(summary_manager.save_summary, cv=cv, summary=''.join(pieces))
+                logger.info(f"Summary streamed for {resource['name']}")
+            except Exception as e:
+                logger.error(f"Summary streamed for {resource['name']} but not saved: {e}")
+        else:
+            logger.warning(f"Empty summary streamed for {resource['name']}, not saved")
+
+    return StreamingResponse(events(), media_type='text/event-stream')
+
+
 @app.get('/extract/')
-def extract(jobpost: dict) -> dict:
+async def extract(jobpost: dict) -> dict:
     """
     End Point used in the 1_Semantic page to extract the Skills from the text inserted by the user
     via the file_iploader or the text_area
@@ -272,7 +503,7 @@ def extract(jobpost: dict) -> dict:
 
     :return: dictionary containing the list of skills extracted from the text and a default evaluation of 0.5
     """
-    answer, *_ = llm.get_skill(jobpost_txt=jobpost['text'])
+    answer, *_ = await llm_pool.run(llm.get_skill, jobpost_txt=jobpost['text'])
     return json.loads(answer)
 
 
@@ -283,8 +514,9 @@ def info() -> dict:
 
     :return: dictionary with the ids and the cvs of the resources
     """
-    return {'ids': [cv.get_idx() for cv in cvs.get_cvs()],
-            'names': [cv.person.resource_name for cv in cvs.get_cvs()]}
+    state = archive_state
+    return {'ids': [cv.get_idx() for cv in state.cvs.get_cvs()],
+            'names': [cv.person.resource_name for cv in state.cvs.get_cvs()]}
 
 
 import csv
@@ -308,4 +540,4 @@ def send_feedback(research_type: str, feedback: int, note: str, search_info: str
 
 
 if __name__ == "__main__":
-    uvicorn.run(app=app, port=8001, host='10.1.2.97')
+    uvicorn.run(app=app, port=int(os.getenv('API_PORT', 8001)), host=os.getenv('API_HOST', '10.1.2.97'))
@@ -0,0 +1,230 @@
+from components.fragments import FragmentMatrix
+from components.logger import logger
+from components.person import Person
+from components.cv import CVperson
+
+import numpy as np
+import shutil
+import pickle
+import json
+import os
+
+
+class ArchiveWriter:
+    """
+    A class to write a CV archive record by record while it is built.
+
+    ...
+
+    Each CV object is appended once to a checkpoint file as a pickled record, instead of pickling the whole growing
+    collection after every CV. The checkpoint is flushed to disk every few records, an interrupted build is resumed
+    from the valid records of the checkpoint, and at the end the archive is written atomically with the name and
+    the format expected by CVS.load_pkl.
+
+    Attributes
+    ----------
+    name : str
+        the name of the final archive, without extension
+    folder : str
+        the folder of the archives
+    flush_every : int
+        the number of records written between two flushes of the checkpoint
+    checkpoint_path : str
+        the path of the checkpoint file
+
+    Methods
+    -------
+    resume() -> list[CVperson]:
+        Returns the CVs already written in the checkpoint and opens it for appending.
+    append(cv: CVperson) -> None:
+        Appends a CV record to the checkpoint.
+    flush() -> None:
+        Flushes the checkpoint to disk.
+    finalize(cvs: list[CVperson]) -> str:
+        Writes the final archive atomically and removes the checkpoint.
+    """
+    def __init__(self, name: str, folder: str = "source/archive", flush_every: int = 50):
+        self.name = name
+        self.folder = folder
+        self.flush_every = flush_every
+        self.checkpoint_path = os.path.join(folder, f".{name}.checkpoint")
+        self._file = None
+        self._pending = 0
+
+    def resume(self) -> list['CVperson']:
+        """
+        Read the records already in the checkpoint, truncate a partially written last record and open the checkpoint
+        for appending.
+
+        :return: the list of the CV objects written by a previous interrupted build
+        """
+        records = []
+        valid_size = 0
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'rb') as f:
+                while True:
+                    try:
+                        records.append(pickle.load(f))
+                        valid_size = f.tell()
+                    except EOFError:
+                        break
+                    except (pickle.UnpicklingError, AttributeError, ValueError, IndexError) as e:
+                        logger.warning(f"Checkpoint {self.checkpoint_path} truncated after {len(records)} records: {e}")
+                        break
+            logger.info(f"Resuming the archive {self.name} from {len(records)} records")
+
+        self._file = open(self.checkpoint_path, 'ab')
+        self._file.truncate(valid_size)
+        return records
+
+    def append(self, cv: 'CVperson') -> None:
+        """
+        Append one CV record to the checkpoint, flushing it every flush_every records.
+
+        :param cv: the CV object to write
+
+        :return: nothing
+        """
+        if self._file is None:
+            self._file = open(self.checkpoint_path, 'ab')
+        pickle.dump(cv, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def finalize(self, cvs: list['CVperson']) -> str:
+        """
+        Write the final archive to a temporary file and rename it to the archive name, so a reader never sees a
+        partial archive, then remove the checkpoint.
+
+        :param cvs: the list of CV objects of the archive
+
+        :return: the path of the final archive
+        """
+        self.close()
+        final_path = os.path.join(self.folder, f"{self.name}.pkl")
+        tmp_path = final_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(cvs, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, final_path)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        logger.info(f"Archive {final_path} finalized with {len(cvs)} CVs")
+        return final_path
+
+
+class ColumnarArchive:
+    """
+    A class to read and write the CV archive in a columnar format next to the legacy pickle.
+
+    ...
+
+    The archive is a folder with the normalized fragment embeddings of all the CVs in a single float32 .npy file,
+    the row bounds of each CV in a second .npy file and a compact JSON table with the resource code, the body and
+    the Person fields of each CV. The embeddings are opened with np.load(mmap_mode='r'), so loading does not read
+    them and several processes share the same pages through the OS page cache.
+
+    Methods
+    -------
+    write(cvs: list[CVperson], path: str, replace: bool = False) -> None:
+        Writes the CVs to a temporary folder and renames it to the archive folder.
+    read(path: str) -> (list[CVperson], FragmentMatrix):
+        Reads the CVs from the archive folder with the embeddings memory-mapped.
+    is_complete(path: str) -> bool:
+        Returns True if the path is an archive folder with all its files.
+    """
+    FRAGMENTS = 'fragments.npy'
+    BOUNDS = 'bounds.npy'
+    METADATA = 'metadata.json'
+
+    @staticmethod
+    def write(cvs: list['CVperson'], path: str, replace: bool = False) -> None:
+        """
+        Write the CVs to a temporary folder, streaming the embeddings into the .npy file, then rename it to the
+        archive folder. A complete archive folder is never deleted in place: it is kept when another process has
+        already written it, or renamed aside before the new one takes its name, so its readers keep their pages.
+
+        :param cvs: the list of CV objects to write, they are written grouped by business line
+        :param path: the path of the archive folder
+        :param replace: boolean to replace an archive folder already complete, instead of keeping it
+
+        :return: nothing
+        """
+        if not replace and ColumnarArchive.is_complete(path):
+            logger.info(f"Columnar archive {path} already written")
+            return
+
+        cvs = sorted(cvs, key=FragmentMatrix.shard_key)
+        bounds = np.zeros(len(cvs) + 1, dtype=np.int64)
+        bounds[1:] = np.cumsum([len(cv.get_fragment()) for cv in cvs])
+        dim = next((len(cv.get_fragment()[0]) for cv in cvs if len(cv.get_fragment())), 0)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+
+        matrix = np.lib.format.open_memmap(os.path.join(tmp_path, ColumnarArchive.FRAGMENTS), mode='w+',
+                                           dtype=np.float32, shape=(int(bounds[-1]), dim))
+        for i, cv in enumerate(cvs):
+            if bounds[i + 1] > bounds[i]:
+                matrix[bounds[i]:bounds[i + 1]] = FragmentMatrix.normalize(cv.get_fragment())
+        matrix.flush()
+        del matrix
+        np.save(os.path.join(tmp_path, ColumnarArchive.BOUNDS), bounds)
+
+        with open(os.path.join(tmp_path, ColumnarArchive.METADATA), 'w') as f:
+            json.dump([{'idx': cv.get_idx(), 'body': cv.get_body(), 'person': cv.person.to_dict()} for cv in cvs],
+                      f, default=str)
+
+        if ColumnarArchive.is_complete(path) and not replace:
+            shutil.rmtree(tmp_path)
+            logger.info(f"Columnar archive {path} written by another process in the meantime")
+            return
+        old_path = f"{path}.{os.getpid()}.old"
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+        logger.info(f"Columnar archive {path} written with {len(cvs)} CVs and {bounds[-1]} fragments")
+
+    @staticmethod
+    def is_complete(path: str) -> bool:
+        files = (ColumnarArchive.FRAGMENTS, ColumnarArchive.BOUNDS, ColumnarArchive.METADATA)
+        return os.path.isdir(path) and all(os.path.isfile(os.path.join(path, file_name)) for file_name in files)
+
+    @staticmethod
+    def read(path: str) -> (list['CVperson'], 'FragmentMatrix'):
+        """
+        Read the CVs from the archive folder. The fragments of each CV are views on the memory-mapped matrix.
+
+        :param path: the path of the archive folder
+
+        :return: the list of CV objects and the FragmentMatrix of the collection
+        """
+        matrix = np.load(os.path.join(path, ColumnarArchive.FRAGMENTS), mmap_mode='r')
+        bounds = np.load(os.path.join(path, ColumnarArchive.BOUNDS))
+        with open(os.path.join(path, ColumnarArchive.METADATA), 'r') as f:
+            records = json.load(f)
+
+        cvs = [CVperson(idx=record['idx'], body=record['body'], person=Person.load_from_record(record['person']),
+                        fragments=matrix[bounds[i]:bounds[i + 1]])
+               for i, record in enumerate(records)]
+        fragment_matrix = FragmentMatrix.from_bounds(matrix=matrix, bounds=bounds, ids=[cv.get_idx() for cv in cvs],
+                                                     business_lines=[cv.person.get_coe() for cv in cvs])
+        return cvs, fragment_matrix
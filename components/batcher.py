@@ -0,0 +1,144 @@
+from components.embedding_cache import embedding_cache
+from components.constants import BertModel
+from components.logger import logger
+
+from concurrent.futures import Future
+import numpy as np
+import threading
+import queue
+import time
+import os
+
+
+class EmbeddingBatcher:
+    """
+    A class to encode together the texts of concurrent requests, collected over a short time window.
+
+    ...
+
+    Every search encodes only a handful of short keywords, which underuses the transformer. The batcher collects the
+    encode requests of the concurrent handlers for at most window_ms milliseconds, or until max_batch_size texts are
+    waiting, encodes them with a single call through the embedding cache and gives back to each request its own
+    embeddings. It has the same encode method of EmbeddingCache, so it can be passed as the encoder of Keywords.
+
+    Attributes
+    ----------
+    window_ms : float
+        the maximum time, in milliseconds, the first request of a batch waits for other requests
+    max_batch_size : int
+        the maximum number of texts encoded together
+    batches : int
+        the number of batches encoded
+    requests : int
+        the number of requests served
+    texts : int
+        the number of texts encoded
+
+    Methods
+    -------
+    encode(texts: list[str], bert_model: BertModel, batch_size: int) -> np.ndarray:
+        Returns the embeddings of the texts, encoded together with the texts of the concurrent requests.
+    get_stats() -> dict:
+        Returns the batch size, latency and throughput statistics.
+    """
+    def __init__(self, window_ms: float = 5.0, max_batch_size: int = 64):
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self._wait_time = 0.0
+        self._encode_time = 0.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+                self._thread.start()
+
+    def encode(self, texts: list[str], bert_model: 'BertModel' = BertModel.GTE_LARGE,
+               batch_size: int = 32) -> 'np.ndarray':
+        """
+        Queue the texts for the next batch and wait for their embeddings.
+
+        :param texts: the list of texts to encode
+        :param bert_model: the BertModel constant of the model to use
+        :param batch_size: not used, the texts are encoded in batches of max_batch_size
+
+        :return: float32 matrix (n_texts, dim) with the embeddings in the same order of the texts
+        """
+        if not texts:
+            return embedding_cache.encode(texts, bert_model)
+        self._start()
+        future = Future()
+        self._queue.put((list(texts), bert_model, future, time.perf_counter()))
+        return future.result()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            try:
+                n_texts = len(batch[0][0])
+                deadline = time.perf_counter() + self.window_ms / 1000
+                while n_texts < self.max_batch_size:
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                    n_texts += len(batch[-1][0])
+                self._encode_batch(batch)
+            except Exception as e:
+                # the thread serves all the future requests, so it fails the batch and keeps running
+                logger.error(f"Error in the embedding batcher with a batch of {len(batch)} requests: {e}")
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _encode_batch(self, batch: list[tuple]) -> None:
+        start_time = time.perf_counter()
+        for bert_model in dict.fromkeys(bert_model for _, bert_model, _, _ in batch):
+            requests = [request for request in batch if request[1] == bert_model]
+            try:
+                embeddings = embedding_cache.encode([text for texts, *_ in requests for text in texts], bert_model,
+                                                    batch_size=self.max_batch_size)
+            except Exception as e:
+                logger.error(f"Error encoding a batch of {len(requests)} requests: {e}")
+                for _, _, future, _ in requests:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for texts, _, future, _ in requests:
+                future.set_result(embeddings[offset:offset + len(texts)])
+                offset += len(texts)
+
+        end_time = time.perf_counter()
+        with self._lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.texts += sum(len(texts) for texts, *_ in batch)
+            self._wait_time += sum(start_time - submit_time for *_, submit_time in batch)
+            self._encode_time += end_time - start_time
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {'window_ms': self.window_ms,
+                    'max_batch_size': self.max_batch_size,
+                    'queued': self._queue.qsize(),
+                    'batches': self.batches,
+                    'requests': self.requests,
+                    'texts': self.texts,
+                    'avg_requests_per_batch': round(self.requests / self.batches, 2) if self.batches else None,
+                    'avg_texts_per_batch': round(self.texts / self.batches, 2) if self.batches else None,
+                    'avg_wait_ms': round(self._wait_time / self.requests * 1000, 1) if self.requests else None,
+                    'avg_encode_ms': round(self._encode_time / self.batches * 1000, 1) if self.batches else None,
+                    'texts_per_second': round(self.texts / self._encode_time, 1) if self._encode_time else None}
+
+
+embedding_batcher = EmbeddingBatcher(window_ms=float(os.getenv('EMBEDDING_BATCH_WINDOW_MS', 5)),
+                                     max_batch_size=int(os.getenv('EMBEDDING_BATCH_SIZE', 64)))
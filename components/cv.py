@@ -1,14 +1,17 @@
+from components.embedding_cache import embedding_cache
+from components.registry import model_registry
 from components.constants import BertModel
+from components.matcher import KeywordMatcher
 from components.logger import logger
 from components.person import Person
 # from components.skill import Skill
 
 from sklearn.metrics.pairwise import cosine_similarity
 from langchain_text_splitters import TokenTextSplitter
-from sentence_transformers import SentenceTransformer
 # from fuzzysearch import find_near_matches
-from transformers import AutoTokenizer
+from functools import lru_cache
 from typing import Union
+import hashlib
 
 
 class CVperson:
@@ -17,9 +20,9 @@ class CVperson:
         self.body = body
         self.person = person
         self.bert_model = BertModel.GTE_LARGE
-        embedding_model = SentenceTransformer(self.bert_model.value)
         if fragments is None:
-            self.fragments = self.embed(embedding_model, self.split(text=body, model=self.bert_model.value))
+            self.fragments = embedding_cache.encode(self.split(text=body, model=self.bert_model.value),
+                                                    self.bert_model).tolist()
         else:
             self.fragments = fragments
 
@@ -43,28 +46,24 @@ class CVperson:
 
         :return: the list of string fragments
         """
-        tokenizer = AutoTokenizer.from_pretrained(model)
-        text_splitter = TokenTextSplitter.from_huggingface_tokenizer(
-            tokenizer, chunk_size=128, chunk_overlap=50
-        )
-        logger.debug(f"Text split into {len(text_splitter.split_text(text))} fragments")
-        return text_splitter.split_text(text)
+        fragments = CVperson.get_text_splitter(model).split_text(text)
+        logger.debug(f"Text split into {len(fragments)} fragments")
+        return fragments
 
     @staticmethod
-    def embed(model, docs: list[str]) -> list[list[float]]:
+    @lru_cache(maxsize=None)
+    def get_text_splitter(model: str) -> 'TokenTextSplitter':
         """
-        Embed the list of fragments using the Sentence Transformer model
+        Build the text splitter for the model once, it is shared by all the CVs split in the process
 
-        :param model: the Model to use for the embedding
-        :param docs: the list of fragments to embedded
+        :param model: the model used for Tokenization and Embedding
 
-        :return: the list of embedded fragments represented in float list values
+        :return: the TokenTextSplitter of the model
         """
-        embedded_docs = []
-        for doc in docs:
-            embedded_docs.append(model.encode(doc))
-        logger.debug("CV embedding completed")
-        return [arr.tolist() for arr in embedded_docs]
+        tokenizer = model_registry.get_tokenizer(BertModel(model))
+        return TokenTextSplitter.from_huggingface_tokenizer(
+            tokenizer, chunk_size=128, chunk_overlap=50
+        )
 
     def match_words(self, words: list[list[float]]) -> list[float]:
         """
@@ -103,20 +102,22 @@ class CVperson:
         """
         return 1 if un_embedded_word.lower() in self.body.lower() else 0
 
-    def match_text(self, un_embedded_words: list[str] | str) -> dict[str, int]:
+    def match_text(self, un_embedded_words: list[str] | str | KeywordMatcher, counts: bool = False) -> dict[str, int]:
         """
-        Check if the CV contains the required list of words
+        Check if the CV contains the required list of words, with a single pass over the body
 
-        :param un_embedded_words: list of words to look-up in the CV object
+        :param un_embedded_words: list of words, or KeywordMatcher already compiled, to look-up in the CV object
+        :param counts: boolean to return the number of occurrences of each word instead of its presence
 
-        :return: List of 1s representing the presence of the words in the CV
+        :return: List of 1s representing the presence of the words in the CV, or the occurrences of the words
         """
-        res = {}
         if isinstance(un_embedded_words, str):
             un_embedded_words = [un_embedded_words]
-        for word in un_embedded_words:
-            res[word] = self.find_in_text(word)
-        return res
+        if not isinstance(un_embedded_words, KeywordMatcher):
+            un_embedded_words = KeywordMatcher(un_embedded_words)
+        if counts:
+            return un_embedded_words.find(self.body)
+        return un_embedded_words.match(self.body)
 
     def set_score(self, score: float) -> None:
         self.score = score
@@ -133,6 +134,43 @@ class CVperson:
     def get_body(self) -> str:
         return self.body
 
+    def get_snippet(self, length: int = 300, words: list[str] = None) -> str:
+        """
+        Return a short part of the body, centered on the first occurrence of the words when they are found.
+
+        :param length: the number of characters of the snippet
+        :param words: list of words around which the snippet is taken [optional]
+
+        :return: the snippet of the body
+        """
+        start = 0
+        if words:
+            occurrences = [positions[0] for positions in KeywordMatcher(words).find(self.body, positions=True).values()
+                           if positions]
+            if occurrences:
+                start = max(self.original_offset(self.body, min(occurrences)) - length // 2, 0)
+        return self.body[start:start + length]
+
+    @staticmethod
+    def original_offset(text: str, offset: int) -> int:
+        """
+        Map an offset of the lowercased text, where the KeywordMatcher finds the words, back to the original text:
+        a few characters, like 'İ', change length when lowercased.
+
+        :param text: the original text
+        :param offset: the offset in text.lower()
+
+        :return: the offset of the same character in the original text
+        """
+        if len(text.lower()) == len(text):
+            return offset
+        lowered = 0
+        for position, char in enumerate(text):
+            lowered += len(char.lower())
+            if lowered > offset:
+                return position
+        return len(text)
+
     def get_information(self) -> dict:
         return self.person.present_person()
 
@@ -142,12 +180,27 @@ class CVperson:
     def get_resume_date(self) -> str:
         return self.person.get_resume_date()
 
+    def get_content_hash(self) -> str:
+        return self.hash_body(self.body)
+
+    @staticmethod
+    def hash_body(body: str) -> str:
+        return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
     def to_dict(self):
         return self.__dict__
 
-    @classmethod
-    def read_from_dict(cls, idx: str, cv_dict: dict):
+    @staticmethod
+    def parse_dict(cv_dict: dict) -> (str, dict):
+        """
+        Separate the plain text of the CV from the information of the Person in a row of the database
+
+        :param cv_dict: the dictionary of the row extracted by the SQLManager
+
+        :return: the body of the CV and the dictionary of the Person information
+        """
         info = {}
+        body = None
 
         for key, value in cv_dict.items():
             match key:
@@ -156,4 +209,9 @@ class CVperson:
                 case _:
                     info[key] = value
 
+        return body, info
+
+    @classmethod
+    def read_from_dict(cls, idx: str, cv_dict: dict):
+        body, info = cls.parse_dict(cv_dict)
         return cls(idx=idx, body=body, person=Person.load_from_dict(info))
@@ -1,5 +1,9 @@
 from altair import DateTime
 
+from components.fragments import FragmentMatrix
+from components.archive import ColumnarArchive
+from components.text_index import TextIndex
+from components.matcher import KeywordMatcher
 from components.cv import CVperson
 from components.logger import logger
 
@@ -21,6 +25,12 @@ class CVS:
     ----------
     cvs : list[CV]
         a list of CV objects
+    by_idx : dict[str, CV]
+        index of the CV objects by resource code
+    by_name : dict[str, CV]
+        index of the CV objects by resource name
+    by_business_line : dict[str, list[CV]]
+        the CV objects of each business line
 
     Methods
     -------
@@ -32,14 +42,24 @@ class CVS:
         Returns the CV object at the specified index.
     __setitem__(idx: int, cv: CV):
         Sets the CV object at the specified index.
-        delete(resource: str):
-    Deletes the CV object with the specified resource.
+    delete(resource: str):
+        Deletes the CV object with the specified resource.
     get_cvs():
         Returns the list of CV objects.
+    get_fragment_matrix():
+        Returns the FragmentMatrix with the fragments of all the CVs, built on the first call.
+    get_text_index():
+        Returns the TextIndex over the bodies of all the CVs, built on the first call.
+    get_identity():
+        Returns the archive name and the generation of the collection, it changes at every modification.
     dump():
         Returns a dictionary representation of the CVS object.
     save_json(filename: str):
         Saves the CVS object to a JSON file.
+    save_columnar(filename: str, replace: bool):
+        Saves the CVS object to a columnar archive folder with memory-mappable embeddings.
+    load():
+        Loads the most recent archive, preferring the columnar format to the pickle.
     load_from_json(filename: str):
         Loads a CVS object from a JSON file.
     """
@@ -47,6 +67,14 @@ class CVS:
         if cvs is None:
             cvs = []
         self.cvs = cvs
+        self.by_idx = {}
+        self.by_name = {}
+        self.by_business_line = {}
+        self.archive_name = None
+        self._generation = 0
+        self._fragment_matrix = None
+        self._text_index = None
+        self._reindex()
 
     def __len__(self) -> int:
         return len(self.cvs)
@@ -57,17 +85,20 @@ class CVS:
 
         :param other: the CV or CVS object to add
 
-        :return: the new CVS object
+        :return: the same CVS object, updated with the new CVs
         """
         # if isinstance(other, CV):
         #     logger.debug("CV added to the CVs collection")
         #     return CVS(self.cvs.append(other))
         if isinstance(other, CVperson):
             logger.debug("CV added to the CVs collection")
-            return CVS(self.cvs.append(other))
+            self.add_cv(other)
+            return self
         elif isinstance(other, CVS):
             logger.debug("CVs added to the CVs collection")
-            return CVS(self.cvs.extend(other.cvs))
+            for cv in other.cvs:
+                self.add_cv(cv)
+            return self
         else:
             raise TypeError("other must be an instance of CV or CVS")
 
@@ -82,23 +113,70 @@ class CVS:
         #     logger.debug("CV added to the CVs collection")
         if isinstance(cv, CVperson):
             self.cvs.append(cv)
+            self._index_cv(cv)
+            self._invalidate()
             logger.debug("CV added to the CVs collection")
         else:
             raise TypeError("cv must be an instance of CV")
 
     def __setitem__(self, idx: int, cv: CVperson) -> None:
         self.cvs[idx] = cv
+        self._reindex()
+        self._invalidate()
 
-    def filter(self, skill: str) -> list['CVperson']:
+    def _index_cv(self, cv: 'CVperson') -> None:
         """
-        Filter the collection of CVs by checking if they match with the wanted skill.
+        Add the CV to the indexes by resource code and by name, the first CV inserted wins on duplicates.
 
-        :param skill: the skill to match
+        :param cv: the CV object to index
 
-        :return: the list of CVs that match the skill
+        :return: nothing
         """
-        logger.debug(f"Filtering CVs with skill: {skill}")
-        return [cv for cv in self.cvs if cv.match_skill(skill)]
+        self.by_idx.setdefault(cv.get_idx(), cv)
+        self.by_name.setdefault(cv.get_resource_name(), cv)
+        self.by_business_line.setdefault(cv.person.get_coe(), []).append(cv)
+
+    def _reindex(self) -> None:
+        """
+        Rebuild the indexes by resource code and by name from the list of CVs.
+
+        :return: nothing
+        """
+        self.by_idx = {}
+        self.by_name = {}
+        self.by_business_line = {}
+        for cv in self.cvs:
+            self._index_cv(cv)
+
+    def _invalidate(self) -> None:
+        """
+        Drop the structures derived from the list of CVs, they are rebuilt on the next request.
+
+        :return: nothing
+        """
+        self._fragment_matrix = None
+        self._text_index = None
+        self._generation += 1
+
+    def get_identity(self) -> tuple[str, int]:
+        """
+        Return the identity of the collection, used to know when the results computed on it are out of date.
+
+        :return: the name of the loaded archive and the number of modifications of the collection
+        """
+        return self.archive_name, self._generation
+
+    def filter(self, bl: str | list[str]) -> list['CVperson']:
+        """
+        Filter the collection of CVs by business line, reading the CVs of each business line from its shard.
+
+        :param bl: the business line, or the list of business lines, to match
+
+        :return: the list of CVs that match the business lines
+        """
+        logger.debug(f"Filtering CVs with business line: {bl}")
+        business_lines = [bl] if isinstance(bl, str) else list(dict.fromkeys(bl))
+        return [cv for business_line in business_lines for cv in self.by_business_line.get(business_line, [])]
 
     def alike_filter(self, words: list[str], threshold: int = 5) -> list[CVperson]:
         """
@@ -110,25 +188,52 @@ class CVS:
         :return: the list of CVs that match the words
         """
         logger.info(f"Filtering CVs with words: {words} and threshold: {threshold}")
-        return [cv for cv in self.cvs if sum(cv.match_text(words)) > threshold]
+        matcher = KeywordMatcher(words)
+        return [cv for cv in self.cvs if sum(cv.match_text(matcher).values()) > threshold]
 
     def delete(self, resource: str) -> None:
-        for cv in self.cvs:
-            if cv.get_idx() == resource:
-                logger.debug(f"Deleting CV {resource}")
-                del cv
+        """
+        Delete from the collection all the CV objects with the given resource code.
+
+        :param resource: the resource code of the CV to delete
+
+        :return: nothing
+        """
+        if resource in self.by_idx:
+            logger.debug(f"Deleting CV {resource}")
+            self.cvs[:] = [cv for cv in self.cvs if cv.get_idx() != resource]
+            self._reindex()
+            self._invalidate()
 
     def get_cvs(self) -> list['CVperson']:
         return self.cvs
 
+    def get_fragment_matrix(self) -> 'FragmentMatrix':
+        """
+        Return the contiguous matrix of the fragments of all the CVs, building it on the first call.
+
+        :return: the FragmentMatrix of the collection
+        """
+        if self._fragment_matrix is None:
+            self._fragment_matrix = FragmentMatrix.from_cvs(self.cvs)
+        return self._fragment_matrix
+
+    def get_text_index(self) -> 'TextIndex':
+        """
+        Return the inverted index over the lowercased bodies of all the CVs, building it on the first call.
+
+        :return: the TextIndex of the collection
+        """
+        if self._text_index is None:
+            self._text_index = TextIndex.from_cvs(self.cvs)
+        return self._text_index
+
     def get_cv(self, idx: str) -> Union['CV', 'CVperson', None]:
         try:
             if (not isinstance(idx, str)) or (len(idx) < 3):
                 raise ValueError("idx must be a string of at least 3 characters")
 
-            for cv in self.cvs:
-                if cv.get_idx() == idx:
-                    return cv
+            return self.by_idx.get(idx)
         except KeyError:
             logger.error(f"CV with index: {idx} not found")
             return None
@@ -139,9 +244,7 @@ class CVS:
     def get_cv_byname(self, name: str) -> Union['CVperson', None]:
         try:
             if isinstance(name, str):
-                for cv in self.get_cvs():
-                    if cv.get_resource_name() == name:
-                        return cv
+                return self.by_name.get(name)
         except KeyError:
             logger.error(f"CV with name: {name} not found")
             return None
@@ -169,13 +272,29 @@ class CVS:
         except Exception as e:
             logger.error(f"An error occurred: {e}")
 
-    def save(self, name: str, pkl_file: bool = True, json_file: bool = True) -> None:
+    def save_columnar(self, filename: str, replace: bool = False) -> None:
+        """
+        Save the CVS object to a columnar archive folder: the embeddings in a float32 .npy file and the
+        information of the CVs in a compact JSON table.
+
+        :param filename: name of the folder where to save the object
+        :param replace: boolean to replace the folder when it is already complete, instead of keeping it
+
+        :return:nothing
+        """
+        try:
+            ColumnarArchive.write(cvs=self.cvs, path="source/archive/" + filename, replace=replace)
+        except Exception as e:
+            logger.error(f"An error occurred: {e}")
+
+    def save(self, name: str, pkl_file: bool = True, json_file: bool = True, columnar: bool = False) -> None:
         """
-        Save the CVS object to a pickle file and/or json file.
+        Save the CVS object to a pickle file and/or json file and/or columnar archive.
 
         :param name: name of the file where to save the object
         :param pkl_file: boolean to save the object to a pickle file
         :param json_file: boolean to save the object to a json file
+        :param columnar: boolean to save the object to a columnar archive folder
 
         :return:nothing
         """
@@ -183,14 +302,18 @@ class CVS:
             self.save_pkl(filename=name)
         if json_file:
             self.save_json(filename=name)
+        if columnar:
+            self.save_columnar(filename=name)
 
     @staticmethod
-    def _search_most_recent() -> (str, datetime):
+    def _search_most_recent(extension: str = ".pkl") -> (str, datetime):
         file_data = []
         for file in os.listdir("source/archive"):
-            if file.startswith("archive_") and file.endswith(".pkl"):
+            if file.startswith("archive_") and file.endswith(extension):
+                if not extension and not ColumnarArchive.is_complete(os.path.join("source/archive", file)):
+                    continue
                 try:
-                    date_str = file[len("archive_"):-4]
+                    date_str = file[len("archive_"):len(file) - len(extension)]
                     date = datetime.strptime(date_str, "%d_%m_%Y")
                     file_data.append((file, date))
                 except ValueError:
@@ -202,6 +325,16 @@ class CVS:
         else:
             return None
 
+    @staticmethod
+    def get_most_recent_archive() -> Union[tuple[str, datetime], None]:
+        """
+        Return the most recent columnar archive. A columnar folder gets its name only when the writer has finished
+        it, so the archive returned can be opened while a newer one is being written.
+
+        :return: the name and the date of the most recent columnar archive, None if there is no columnar archive
+        """
+        return CVS._search_most_recent(extension="")
+
     def load_pkl(self) -> None:
         """
         Load a CVS object from a pickle file.
@@ -217,6 +350,9 @@ class CVS:
             with open('source/archive/'+filename[0], 'rb') as f:
                 data = pickle.load(f)
             self.cvs = data
+            self.archive_name = filename[0]
+            self._reindex()
+            self._invalidate()
             logger.info(f"File {filename[0]} loaded correctly")
         except FileNotFoundError:
             logger.error(f"No File found with name {filename[0]} for the path 'source/archive/{filename[0]}'")
@@ -224,3 +360,47 @@ class CVS:
             logger.error(f"Error to deserialize the data from the file 'source/archive/{filename[0]}'")
         except Exception as e:
             logger.error(f"An error occurred: {e}")
+
+    def load_columnar(self) -> None:
+        """
+        Load a CVS object from the most recent columnar archive folder, the embeddings are memory-mapped and
+        read from disk only when the search touches them.
+
+        :return:nothing
+        """
+        filename = self._search_most_recent(extension="")
+        logger.info(filename[0])
+
+        try:
+            cvs, fragment_matrix = ColumnarArchive.read(path='source/archive/' + filename[0])
+            self.cvs = cvs
+            self.archive_name = filename[0]
+            self._reindex()
+            self._invalidate()
+            self._fragment_matrix = fragment_matrix
+            logger.info(f"Columnar archive {filename[0]} loaded correctly")
+        except FileNotFoundError:
+            logger.error(f"Columnar archive not complete for the path 'source/archive/{filename[0]}'")
+        except Exception as e:
+            logger.error(f"An error occurred: {e}")
+
+    def load(self, build_columnar: bool = False) -> None:
+        """
+        Load the most recent archive, using the columnar format when it is at least as recent as the pickle.
+
+        :param build_columnar: boolean to write the columnar archive when only the pickle is available, and serve
+            the CVs from it instead of the unpickled copy
+
+        :return:nothing
+        """
+        pkl_file = self._search_most_recent()
+        columnar = self._search_most_recent(extension="")
+        if columnar is not None and (pkl_file is None or columnar[1] >= pkl_file[1]):
+            self.load_columnar()
+        else:
+            self.load_pkl()
+            if build_columnar and pkl_file is not None:
+                self.save_columnar(filename=pkl_file[0][:-len(".pkl")])
+                columnar = self._search_most_recent(extension="")
+                if columnar is not None and columnar[0] == pkl_file[0][:-len(".pkl")]:
+                    self.load_columnar()
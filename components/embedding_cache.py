@@ -0,0 +1,85 @@
+from components.registry import model_registry
+from components.constants import BertModel
+from components.lru import LRUCache
+
+import numpy as np
+import os
+
+
+class EmbeddingCache(LRUCache):
+    """
+    A class to cache the embeddings of the texts encoded by the models, shared by Keywords, Matrix and CVperson.
+
+    ...
+
+    The embeddings are kept in a bounded LRUCache keyed by the model name and the normalized text, so the skills
+    searched again and again are encoded only once. The cache can be saved to disk and loaded at the next start.
+
+    Attributes
+    ----------
+    maxsize : int
+        the maximum number of embeddings kept in memory
+    path : str
+        the file where the cache is persisted, None to keep it only in memory
+    hits : int
+        the number of texts served from the cache
+    misses : int
+        the number of texts encoded by the model
+
+    Methods
+    -------
+    encode(texts: list[str], bert_model: BertModel, batch_size: int) -> np.ndarray:
+        Returns the embeddings of the texts, encoding only the ones not in the cache.
+    get_stats(), save(path: str = None), load(path: str = None):
+        Inherited from LRUCache.
+    """
+    label = 'embedding cache'
+
+    def __init__(self, maxsize: int = 20000, path: str = None):
+        super().__init__(maxsize=maxsize, path=path)
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        return ' '.join(text.split())
+
+    def encode(self, texts: list[str], bert_model: 'BertModel' = BertModel.GTE_LARGE,
+               batch_size: int = 32) -> 'np.ndarray':
+        """
+        Return the embeddings of the texts. The texts not in the cache are encoded together in one call to the
+        model and then added to the cache.
+
+        :param texts: the list of texts to encode
+        :param bert_model: the BertModel constant of the model to use
+        :param batch_size: the number of texts encoded together by the model
+
+        :return: float32 matrix (n_texts, dim) with the embeddings in the same order of the texts
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        keys = [(bert_model.value, self.normalize_text(text)) for text in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                embedding = self._get(key)
+                if embedding is not None:
+                    found[key] = embedding
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            embeddings = model_registry.get_model(bert_model).encode([text for _, text in missing],
+                                                                     batch_size=batch_size)
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            with self._lock:
+                for key, embedding in zip(missing, embeddings):
+                    found[key] = embedding
+                    self._put(key, embedding)
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+        return np.stack([found[key] for key in keys])
+
+
+embedding_cache = EmbeddingCache(maxsize=int(os.getenv('EMBEDDING_CACHE_SIZE', 20000)),
+                                 path=os.getenv('EMBEDDING_CACHE_PATH'))
@@ -3,17 +3,24 @@ import components.config as config
 from openpyxl.utils.exceptions import IllegalCharacterError
 from io import BytesIO
 import pandas as pd
+import requests
 import re
 
 
-def format_results(d: dict) -> pd.DataFrame:
+def fetch_bodies(codes: list[str]) -> dict[str, str]:
+    return requests.get(f"{config.API_URL}/bodies/", json={'codes': codes}).json()
+
+
+def format_results(d: dict, with_body: bool = False) -> pd.DataFrame:
     # columns_order = ['score', 'resource_name', 'company', 'role', 'business_line', 'country_residenza', 'email',
     #                  'cv_docx_name', 'body', 'resume_date', 'status', 'y_in_pqe', 'city_residenza',
     #                  'indirizzo_residenza', 'id_db']
-    df = pd.DataFrame(d).transpose()
-    df = df[config.COLUMNS_LIST]
+    df = pd.DataFrame(d).transpose()[:int(config.N_ROWS)]
+    if with_body:
+        df['body'] = df.index.map(fetch_bodies(df.index.tolist()))
+    df = df[[column for column in config.COLUMNS_LIST if column in df.columns]]
     df.fillna(0, inplace=True)
-    return df[:int(config.N_ROWS)]
+    return df
 
 
 def convert_df_to_excel(df: pd.DataFrame) -> bytes:
@@ -50,10 +57,13 @@ def convert_df_to_excel(df: pd.DataFrame) -> bytes:
 
 def format_logic(res: dict) -> pd.DataFrame:
     df = pd.DataFrame.from_dict(res, orient='index')
+    # Nessun CV supera la soglia: tabella vuota invece di cercare la colonna score
+    if df.empty or 'score' not in df.columns:
+        return pd.DataFrame()
     # Ordina per aggregate_score in ordine decrescente
     df = df.sort_values(by='score', ascending=False)
     # Elimina le righe con aggregate_score pari a 0
     df = df[df['score'] > 0]
     # Rimuovi la colonna aggregate_score
-    df = df.drop(columns=['score', 'body'])
+    df = df.drop(columns=['score', 'body'], errors='ignore')
     return df
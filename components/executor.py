@@ -0,0 +1,121 @@
+from components.logger import logger
+
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Any
+import threading
+import asyncio
+import time
+import os
+
+
+class WorkerPool:
+    """
+    A class to run the blocking work of the API handlers on a bounded pool of threads.
+
+    ...
+
+    Each kind of work (embedding, scoring, LLM calls) has its own pool with a fixed number of threads, so a slow
+    OpenAI call can only occupy the LLM threads and never delays the searches. The async handlers await the result
+    without blocking the event loop, and the pool counts the tasks waiting in its queue and the running ones.
+
+    Attributes
+    ----------
+    name : str
+        the name of the pool
+    max_workers : int
+        the number of threads of the pool
+    queued : int
+        the number of tasks waiting for a free thread
+    active : int
+        the number of tasks running
+    max_queued : int
+        the maximum number of tasks waiting at the same time
+    completed : int
+        the number of tasks completed
+    failed : int
+        the number of tasks completed with an exception
+
+    Methods
+    -------
+    run(func: Callable, *args, **kwargs) -> Any:
+        Runs the function on the pool and returns its result to the awaiting handler.
+    get_stats() -> dict:
+        Returns the queue depth and the timing statistics of the pool.
+    shutdown() -> None:
+        Stops the threads of the pool.
+    """
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.queued = 0
+        self.active = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.failed = 0
+        self._wait_time = 0.0
+        self._run_time = 0.0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Submit the function to the pool and wait for its result without blocking the event loop.
+
+        :param func: the blocking function to run
+        :param args: the positional arguments of the function
+        :param kwargs: the keyword arguments of the function
+
+        :return: the result of the function
+        """
+        submit_time = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+        def task() -> Any:
+            start_time = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self._wait_time += start_time - submit_time
+            failed = False
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self.failed += failed
+                    self._run_time += time.perf_counter() - start_time
+
+        future = self._executor.submit(task)
+        future.add_done_callback(self._discard_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def _discard_cancelled(self, future: 'Future') -> None:
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {'max_workers': self.max_workers,
+                    'queued': self.queued,
+                    'active': self.active,
+                    'max_queued': self.max_queued,
+                    'completed': self.completed,
+                    'failed': self.failed,
+                    'avg_wait_ms': round(self._wait_time / self.completed * 1000, 1) if self.completed else None,
+                    'avg_run_ms': round(self._run_time / self.completed * 1000, 1) if self.completed else None}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logger.info(f"Worker pool {self.name} stopped: {self.get_stats()}")
+
+
+embedding_pool = WorkerPool(name='embedding', max_workers=int(os.getenv('EMBEDDING_WORKERS', 8)))
+scoring_pool = WorkerPool(name='scoring', max_workers=int(os.getenv('SCORING_WORKERS', 2)))
+llm_pool = WorkerPool(name='llm', max_workers=int(os.getenv('LLM_WORKERS', 8)))
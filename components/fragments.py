@@ -0,0 +1,165 @@
+from components.logger import logger
+
+import numpy as np
+
+
+class FragmentMatrix:
+    """
+    A class to represent the fragment embeddings of a whole collection of CVs as one contiguous matrix.
+
+    ...
+
+    The fragments of every CV are stacked in a single pre-normalized float32 matrix, and the offsets array keeps
+    the first row of each CV, so the similarity of a set of keywords with all the CVs is a single matrix product
+    followed by a segmented max-reduce. The CVs are grouped by business line, so the fragments of each business
+    line are a contiguous block of rows (a shard) and a filtered search only multiplies the rows of its shards.
+
+    Attributes
+    ----------
+    matrix : np.ndarray
+        float32 matrix (n_fragments, dim) with the L2-normalized fragment embeddings
+    offsets : np.ndarray
+        int64 array (n_cvs,) with the first row of each CV in the matrix
+    ids : list[str]
+        the resource codes of the CVs, in the same order of the offsets
+    shards : dict[str, list[tuple[int, int]]]
+        the ranges of CVs (positions in ids) of each business line
+
+    Methods
+    -------
+    from_cvs(cvs: list[CVperson]) -> FragmentMatrix:
+        Builds the matrix from a list of CV objects, grouped by business line.
+    from_bounds(matrix: np.ndarray, bounds: np.ndarray, ids: list[str], business_lines: list[str]) -> FragmentMatrix:
+        Wraps an already normalized matrix, like the one of a columnar archive.
+    normalize(embeddings: np.ndarray) -> np.ndarray:
+        Returns the L2-normalized float32 version of the embeddings.
+    get_ids(business_lines: list[str] = None) -> list[str]:
+        Returns the resource codes of the CVs of the business lines, all of them by default.
+    match_words(words: list[list[float]], business_lines: list[str] = None) -> np.ndarray:
+        Returns the max similarity of each word with the fragments of each CV.
+    score(words: list[list[float]], weights: list[float], business_lines: list[str] = None) -> np.ndarray:
+        Returns the weighted average of the similarities for each CV.
+    """
+    def __init__(self, matrix: 'np.ndarray', offsets: 'np.ndarray', ids: list[str], business_lines: list[str] = None):
+        self.matrix = matrix
+        self.offsets = offsets
+        self.ids = ids
+        self.shards = self._create_shards(business_lines if business_lines is not None else [None] * len(ids))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_cvs(cls, cvs: list['CVperson']) -> 'FragmentMatrix':
+        """
+        Stack the fragments of all the CVs in one normalized matrix, grouping the CVs by business line and
+        skipping the CVs without fragments.
+
+        :param cvs: the list of CV objects
+
+        :return: the FragmentMatrix of the collection
+        """
+        blocks, offsets, ids, business_lines = [], [], [], []
+        n_rows = 0
+        for cv in sorted(cvs, key=cls.shard_key):
+            fragments = np.asarray(cv.get_fragment(), dtype=np.float32)
+            if fragments.ndim != 2 or fragments.shape[0] == 0:
+                logger.warning(f"CV {cv.get_idx()} has no fragments and it is excluded from the semantic search")
+                continue
+            blocks.append(fragments)
+            offsets.append(n_rows)
+            ids.append(cv.get_idx())
+            business_lines.append(cv.person.get_coe())
+            n_rows += fragments.shape[0]
+
+        matrix = cls.normalize(np.vstack(blocks)) if blocks else np.empty((0, 0), dtype=np.float32)
+        logger.debug(f"Fragment matrix built with {matrix.shape[0]} fragments for {len(ids)} CVs")
+        return cls(matrix=matrix, offsets=np.asarray(offsets, dtype=np.int64), ids=ids, business_lines=business_lines)
+
+    @classmethod
+    def from_bounds(cls, matrix: 'np.ndarray', bounds: 'np.ndarray', ids: list[str],
+                    business_lines: list[str] = None) -> 'FragmentMatrix':
+        """
+        Wrap an already normalized matrix, given the row bounds of each CV, skipping the CVs without fragments.
+
+        :param matrix: the normalized fragment matrix, it can be memory-mapped
+        :param bounds: int array (n_cvs + 1,) where the fragments of the CV i are the rows bounds[i]:bounds[i + 1]
+        :param ids: the resource codes of the CVs
+        :param business_lines: the business line of each CV
+
+        :return: the FragmentMatrix of the collection
+        """
+        bounds = np.asarray(bounds, dtype=np.int64)
+        not_empty = bounds[1:] > bounds[:-1]
+        if business_lines is None:
+            business_lines = [None] * len(ids)
+        return cls(matrix=matrix, offsets=bounds[:-1][not_empty],
+                   ids=[idx for idx, keep in zip(ids, not_empty) if keep],
+                   business_lines=[bl for bl, keep in zip(business_lines, not_empty) if keep])
+
+    @staticmethod
+    def shard_key(cv: 'CVperson') -> str:
+        return cv.person.get_coe() or ''
+
+    @staticmethod
+    def _create_shards(business_lines: list[str]) -> dict[str, list[tuple[int, int]]]:
+        shards = {}
+        start = 0
+        for i in range(1, len(business_lines) + 1):
+            if i == len(business_lines) or business_lines[i] != business_lines[start]:
+                shards.setdefault(business_lines[start], []).append((start, i))
+                start = i
+        return shards
+
+    @staticmethod
+    def normalize(embeddings: 'np.ndarray') -> 'np.ndarray':
+        """
+        Normalize each row of the embeddings to unit length, so the dot product is the cosine similarity.
+
+        :param embeddings: the matrix of embeddings, one per row
+
+        :return: the float32 normalized matrix
+        """
+        embeddings = np.array(embeddings, dtype=np.float32, ndmin=2)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+
+    def _select(self, business_lines: list[str] = None) -> list[tuple[int, int]]:
+        if business_lines is None:
+            return [(0, len(self.ids))] if self.ids else []
+        return sorted(cv_range for bl in dict.fromkeys(business_lines) for cv_range in self.shards.get(bl, []))
+
+    def get_ids(self, business_lines: list[str] = None) -> list[str]:
+        return [idx for start, end in self._select(business_lines) for idx in self.ids[start:end]]
+
+    def match_words(self, words: list[list[float]], business_lines: list[str] = None) -> 'np.ndarray':
+        """
+        Compute the similarity of each word with the fragments of the selected shards and keep the max value for
+        each CV.
+
+        :param words: list of float list values representing the list of word embeddings
+        :param business_lines: the business lines of the shards to search, default is the whole collection
+
+        :return: matrix (n_words, n_cvs) with the max similarity of each word in each CV, in the order of get_ids
+        """
+        words = self.normalize(words)
+        results = [np.empty((words.shape[0], 0), dtype=np.float32)]
+        for start, end in self._select(business_lines):
+            first_row = self.offsets[start]
+            last_row = self.offsets[end] if end < len(self.offsets) else self.matrix.shape[0]
+            similarities = words @ self.matrix[first_row:last_row].T
+            results.append(np.maximum.reduceat(similarities, self.offsets[start:end] - first_row, axis=1))
+        return np.concatenate(results, axis=1)
+
+    def score(self, words: list[list[float]], weights: list[float], business_lines: list[str] = None) -> 'np.ndarray':
+        """
+        Compute the weighted average over the words of the max similarity in each CV.
+
+        :param words: list of float list values representing the list of word embeddings
+        :param weights: list of weights for each word
+        :param business_lines: the business lines of the shards to search, default is the whole collection
+
+        :return: array (n_cvs,) with the score of each CV, in the order of get_ids
+        """
+        return np.average(self.match_words(words, business_lines), axis=0, weights=weights)
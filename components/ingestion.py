@@ -0,0 +1,170 @@
+from components.registry import model_registry
+from components.constants import BertModel
+from components.logger import logger
+from components.person import Person
+from components.cv import CVperson
+from components.cvs import CVS
+
+from tqdm import tqdm
+import numpy as np
+import time
+
+
+class CVIngestor:
+    """
+    A class to transform many rows of the database into CV objects in bulk.
+
+    ...
+
+    The bodies of all the CVs are split with one shared splitter, then the fragments of all the CVs are sorted by
+    length and encoded together in large batches, so the model works on batches of similar length instead of
+    encoding one fragment at a time.
+
+    Attributes
+    ----------
+    bert_model : BertModel
+        the model used for the splitting and the embedding
+    batch_size : int
+        the number of fragments encoded together by the model
+    block_size : int
+        the number of fragments sent to the model for each call, used for the progress and the memory bound
+    stats : dict
+        the cumulative counters of the ingestion stages
+
+    Methods
+    -------
+    ingest(cv_dicts: dict[str, dict]) -> list[CVperson]:
+        Creates the CV objects of all the rows given.
+    diff(previous: CVS, cv_dicts: dict[str, dict]) -> (list[CVperson], dict[str, dict]):
+        Reuses the CVs of a previous archive that did not change and returns the rows to ingest.
+    get_stats() -> dict:
+        Returns the counters and the throughput of each stage.
+    report() -> None:
+        Logs the throughput of each stage.
+    """
+    def __init__(self, bert_model: 'BertModel' = BertModel.GTE_LARGE, batch_size: int = 64, block_size: int = 4096):
+        self.bert_model = bert_model
+        self.batch_size = batch_size
+        self.block_size = block_size
+        self.stats = {'cvs': 0, 'skipped': 0, 'fragments': 0, 'split_time': 0.0, 'embed_time': 0.0}
+        self.changes = {}
+
+    def ingest(self, cv_dicts: dict[str, dict]) -> list['CVperson']:
+        """
+        Create the CV objects of all the rows, splitting all the bodies first and embedding all the fragments together.
+
+        :param cv_dicts: dictionary of the rows of the database in the form {resource_code: row}
+
+        :return: the list of CV objects, the rows that cannot be parsed are skipped
+        """
+        start_time = time.time()
+        parsed = []
+        for idx, cv_dict in cv_dicts.items():
+            try:
+                body, info = CVperson.parse_dict(cv_dict)
+                if not isinstance(body, str):
+                    raise TypeError(f"cv_plain_text must be a string, not {type(body).__name__}")
+                person = Person.load_from_dict(info)
+                parsed.append((idx, body, person, CVperson.split(text=body, model=self.bert_model.value)))
+            except (TypeError, KeyError, ValueError, AttributeError) as e:
+                logger.error(f"CV {idx} skipped: {e}")
+                self.stats['skipped'] += 1
+        self.stats['split_time'] += time.time() - start_time
+
+        start_time = time.time()
+        fragments = [fragment for *_, cv_fragments in parsed for fragment in cv_fragments]
+        embeddings = self._embed(fragments)
+        self.stats['embed_time'] += time.time() - start_time
+
+        cvs = []
+        row = 0
+        for idx, body, person, cv_fragments in parsed:
+            cvs.append(CVperson(idx=idx, body=body, person=person,
+                                fragments=embeddings[row:row + len(cv_fragments)].tolist()))
+            row += len(cv_fragments)
+
+        self.stats['cvs'] += len(cvs)
+        self.stats['fragments'] += len(fragments)
+        return cvs
+
+    def diff(self, previous: 'CVS', cv_dicts: dict[str, dict]) -> (list['CVperson'], dict[str, dict]):
+        """
+        Compare the rows of the database with the CVs of a previous archive by resource code, resume date and hash
+        of the plain text. The unchanged CVs keep their fragments and get the updated Person information, the new
+        and modified ones are returned to be ingested, the resources not in the rows anymore are dropped.
+
+        :param previous: the CVS collection of the previous archive
+        :param cv_dicts: dictionary of the rows of the database in the form {resource_code: row}
+
+        :return: the list of the reused CV objects and the dictionary of the rows to ingest
+        """
+        reused, to_ingest = [], {}
+        added = updated = 0
+        for idx, cv_dict in cv_dicts.items():
+            old_cv = previous.get_cv(idx) if isinstance(idx, str) and len(idx) >= 3 else None
+            if old_cv is None:
+                added += 1
+                to_ingest[idx] = cv_dict
+                continue
+            try:
+                body, info = CVperson.parse_dict(cv_dict)
+                person = Person.load_from_dict(info)
+                unchanged = (person.get_resume_date() == old_cv.get_resume_date()
+                             and CVperson.hash_body(body) == old_cv.get_content_hash())
+            except (TypeError, KeyError, ValueError, AttributeError):
+                unchanged = False
+            if unchanged:
+                fragments = old_cv.get_fragment()
+                if isinstance(fragments, np.ndarray):
+                    fragments = fragments.tolist()
+                reused.append(CVperson(idx=idx, body=body, person=person, fragments=fragments))
+            else:
+                updated += 1
+                to_ingest[idx] = cv_dict
+
+        self.changes = {'added': added, 'updated': updated, 'unchanged': len(reused),
+                        'removed': len([cv for cv in previous.get_cvs() if cv.get_idx() not in cv_dicts])}
+        logger.info(f"Archive diff: {self.changes['added']} added, {self.changes['updated']} updated, "
+                    f"{self.changes['unchanged']} unchanged, {self.changes['removed']} removed")
+        return reused, to_ingest
+
+    def _embed(self, fragments: list[str]) -> 'np.ndarray':
+        """
+        Encode the fragments in blocks sorted by length, so each batch holds fragments with a similar number of tokens.
+
+        :param fragments: the list of fragments of all the CVs
+
+        :return: the matrix of the embeddings, in the same order of the fragments given
+        """
+        model = model_registry.get_model(self.bert_model)
+        embeddings = np.empty((len(fragments), model.get_sentence_embedding_dimension()), dtype=np.float32)
+        order = np.argsort([-len(fragment) for fragment in fragments], kind='stable')
+
+        pbar = tqdm(total=len(fragments), desc='Embedding fragments', ascii=True)
+        for start in range(0, len(order), self.block_size):
+            block = order[start:start + self.block_size]
+            # the fragments of a build are never queried again, so they bypass the query embedding cache
+            embeddings[block] = model.encode([fragments[i] for i in block], batch_size=self.batch_size)
+            pbar.update(len(block))
+        pbar.close()
+        return embeddings
+
+    def get_stats(self) -> dict:
+        """
+        Return the cumulative counters of the ingestion and the throughput of each stage.
+
+        :return: dictionary with the counters, the CVs per second of the split and the fragments per second of
+            the embedding
+        """
+        split_time, embed_time = self.stats['split_time'], self.stats['embed_time']
+        return {**self.stats,
+                **self.changes,
+                'split_cvs_per_s': round(self.stats['cvs'] / split_time, 2) if split_time else None,
+                'embed_fragments_per_s': round(self.stats['fragments'] / embed_time, 2) if embed_time else None,
+                'cvs_per_s': round(self.stats['cvs'] / (split_time + embed_time), 2) if split_time + embed_time else None}
+
+    def report(self) -> None:
+        stats = self.get_stats()
+        logger.info(f"Ingested {stats['cvs']} CVs ({stats['skipped']} skipped) and {stats['fragments']} fragments: "
+                    f"split {stats['split_cvs_per_s']} CVs/s, embedding {stats['embed_fragments_per_s']} fragments/s, "
+                    f"overall {stats['cvs_per_s']} CVs/s")
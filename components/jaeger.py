@@ -1,11 +1,10 @@
+from components.matcher import KeywordMatcher
 from components.keywords import Keywords
 from components.logger import logger
 from components.matrix import Matrix
 from components.cvs import CVS
 
-from sklearn.metrics.pairwise import cosine_similarity
 # from typing import Union
-from tqdm import tqdm
 # import pandas as pd
 import numpy as np
 # import json
@@ -15,41 +14,17 @@ class Jaeger:
     def __init__(self, cvs: CVS):
         self.cvs = cvs
 
-    def run_semantic(self, keywords: 'Keywords', bl: str = None) -> dict:
-        results = {}
-        if bl is None:
-            pbar = tqdm(total=len(self.cvs), desc='Processing CVs', ascii=True)
-            for cv in self.cvs.get_cvs():
-                results[cv.get_idx()] = np.average(a=cv.match_words(keywords.get_embedding()),
-                                                   weights=keywords.get_weights())
-                pbar.update(1)
-        else:
-            pbar = tqdm(total=len(self.cvs), desc='Processing CVs', ascii=True)
-            for cv in self.cvs.filter(bl):
-                results[cv.get_idx()] = np.average(a=cv.match_words(keywords.get_embedding()),
-                                                   weights=keywords.get_weights())
-                pbar.update(1)
-            pbar.close()
+    def run_semantic(self, keywords: 'Keywords', bl: str | list[str] = None) -> dict:
+        fragment_matrix = self.cvs.get_fragment_matrix()
+        business_lines = [bl] if isinstance(bl, str) else bl
+        scores = fragment_matrix.score(keywords.get_embedding(), keywords.get_weights(), business_lines=business_lines)
+        results = dict(zip(fragment_matrix.get_ids(business_lines), scores.tolist()))
         logger.debug("Scoring and of CVs completed")
         return results
 
-    def run_alike(self, keywords: list[str], bl: str = None) -> dict:
-        results = {}
-        if bl is None:
-            pbar = tqdm(total=len(self.cvs), desc=f'Processing CVs for {len(keywords)}', ascii=True)
-            for cv in self.cvs.get_cvs():
-                scores = cv.match_text(keywords)
-                results[cv.get_idx()] = {k: v for k, v in scores.items()}
-                # print(f"CV {cv.get_idx()} scored {scores}")
-                pbar.update(1)
-            pbar.close()
-        else:
-            pbar = tqdm(total=len(self.cvs), desc='Processing CVs', ascii=True)
-            for cv in self.cvs.filter(bl):
-                scores = cv.match_text(keywords)
-                results[cv.get_idx()] = sum(scores)
-                pbar.update(1)
-            pbar.close()
+    def run_alike(self, keywords: list[str], bl: str | list[str] = None, matcher: 'KeywordMatcher' = None) -> dict:
+        business_lines = [bl] if isinstance(bl, str) else bl
+        results = self.cvs.get_text_index().match(keywords, business_lines=business_lines, matcher=matcher)
         logger.debug("Scoring and of CVs with alike completed")
         return results
 
@@ -60,21 +35,11 @@ class Jaeger:
 
         :return:
         """
-        key_extract = []
-        for keyw in keywords.get_embedding():
-            max_sim = -1
-            max_key = None
-            for key, embed in matrix.get_embed().items():
-                logger.debug(keyw, key)
-                similarity = cosine_similarity(np.array(keyw).reshape(1, -1), np.array(embed).reshape(1, -1))
-                if similarity > max_sim:
-                    max_sim = similarity
-                    max_key = key
-            key_extract.append(max_key)
+        key_extract = [candidates[0][0] for candidates in matrix.resolve(keywords.get_embedding())]
         logger.debug(key_extract)
         return matrix.sort_data(key_extract)
 
-    def sort_results(self, keywords: 'Keywords', bl: str = None) -> dict:
+    def sort_results(self, keywords: 'Keywords', bl: str | list[str] = None) -> dict:
         results = self.run_semantic(keywords, bl)
         return {k: float(v) for k, v in sorted(results.items(), key=lambda item: item[1], reverse=True)}
 
@@ -82,56 +47,118 @@ class Jaeger:
     def sort_scoring(results: dict) -> dict:
         return dict(sorted(results.items(), key=lambda item: item[1], reverse=True))
 
-    def normalize_scores(self, keywords: 'Keywords', bl: str = None, runtype: str = 'semantic') -> dict:
+    @staticmethod
+    def top_k(results: dict, k: int = None, threshold: float = None) -> dict:
+        """
+        Rank the scores partially: np.argpartition selects the k best CVs in linear time and only the winners are
+        sorted, with the same order of sort_scoring for equal scores.
+
+        :param results: dictionary {resource_code: score}
+        :param k: the number of best CVs to keep, default is all the CVs
+        :param threshold: the minimum score of the CVs to keep [optional]
+
+        :return: dictionary with the best CVs sorted by descending score
+        """
+        ids = list(results.keys())
+        scores = np.fromiter(results.values(), dtype=np.float64, count=len(ids))
+        candidates = np.arange(len(ids)) if threshold is None else np.flatnonzero(scores >= threshold)
+        if k is not None and k < len(candidates):
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]] if k > 0 else candidates[:0]
+        ranking = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return {ids[i]: results[ids[i]] for i in ranking.tolist()}
+
+    def normalize_scores(self, keywords: 'Keywords', bl: str | list[str] = None, runtype: str = 'semantic',
+                         frequency: bool = False, k: int = None, threshold: float = None) -> dict:
         if runtype == 'logic':
-            return self.run_alike(keywords.get_words(), bl)
+            return self.run_alike(keywords.get_words(), bl, matcher=keywords.get_matcher() if frequency else None)
         else:
             results = self.run_semantic(keywords, bl)
+        if not results:
+            return results
 
         lb, ub, range_scores = min(results.values()), max(results.values()), max(results.values()) - min(
             results.values())
         for user, score in results.items():
             results[user] = (score - lb) / range_scores if range_scores else 0
 
-        return self.sort_scoring(results)
+        return self.top_k(results, k=k, threshold=threshold)
+
 
+    @staticmethod
+    def compile_entry(cv: 'CVperson', scores: dict, fields: list[str] = None, include_body: bool = False) -> dict:
+        """
+        Build the entry of a resource in the response, with the scores and the selected Person fields.
+
+        :param cv: the CV object of the resource
+        :param scores: dictionary with the score, and the score of each keyword for the Logic search
+        :param fields: the Person fields to return, default is all of them
+        :param include_body: boolean to return the body of the CV too
+
+        :return: the dictionary of the resource
+        """
+        person = cv.person.to_dict()
+        if fields is not None:
+            person = {field: person[field] for field in fields if field in person}
+        return {**scores, **({'body': cv.get_body()} if include_body else {}), **person}
+
+    def project(self, results: dict[str, dict], fields: list[str] = None,
+                include_body: bool = False) -> dict[str, dict]:
+        """
+        Project the entries of compact results, like the cached CoE rankings, on the selected Person fields.
+
+        :param results: dictionary {resource_code: entry} compiled without the bodies
+        :param fields: the Person fields to return, default is all of them
+        :param include_body: boolean to add the body of the CVs
+
+        :return: dictionary {resource_code: entry} with the projected entries
+        """
+        if fields is None and not include_body:
+            return results
+        projected = {}
+        for cv_idx, entry in results.items():
+            cv = self.cvs.get_cv(cv_idx)
+            scores = {key: value for key, value in entry.items() if key not in cv.person.to_dict()}
+            projected[cv_idx] = self.compile_entry(cv, scores, fields=fields, include_body=include_body)
+        return projected
 
-    def compile_person(self, keywords: 'Keywords', bl: str = None, runtype: str = 'semantic') -> dict[str, dict]:
+    def compile_person(self, keywords: 'Keywords', bl: str | list[str] = None, runtype: str = 'semantic',
+                       frequency: bool = False, k: int = None, threshold: float = None, fields: list[str] = None,
+                       include_body: bool = False) -> dict[str, dict]:
         enriched = {}
         if runtype == 'logic':
-            results = self.normalize_scores(keywords, bl, runtype=runtype)
-            for cv_idx, keyword_scores in results.items():
+            results = self.normalize_scores(keywords, bl, runtype=runtype, frequency=frequency)
+            aggregate_scores = self.top_k({cv_idx: sum(keyword_scores.values())
+                                           for cv_idx, keyword_scores in results.items()}, k=k, threshold=threshold)
+            for cv_idx, aggregate_score in aggregate_scores.items():
                 cv = self.cvs.get_cv(cv_idx)
-                aggregate_score = sum(keyword_scores.values())
+                keyword_scores = results[cv_idx]
                 cv.set_score(aggregate_score)
-                enriched[cv.get_idx()] = {
-                    'score': aggregate_score,
-                    **{keyword: score for keyword, score in keyword_scores.items()},
-                    'body': cv.get_body(),
-                    **cv.person.to_dict()
-                }
+                enriched[cv.get_idx()] = self.compile_entry(cv, {'score': aggregate_score, **keyword_scores},
+                                                            fields=fields, include_body=include_body)
             return enriched
         else:
-            results = self.normalize_scores(keywords, bl)
+            results = self.normalize_scores(keywords, bl, k=k, threshold=threshold)
         for cv_idx, score in results.items():
             cv = self.cvs.get_cv(cv_idx)
             cv.set_score(score)
-            enriched[cv.get_idx()] = {'score': score,
-                                      'body': cv.get_body(),
-                                      **cv.person.to_dict()}
+            enriched[cv.get_idx()] = self.compile_entry(cv, {'score': score}, fields=fields, include_body=include_body)
         return enriched
 
     def compile_matrix(self, keywords: 'Keywords', matrix: 'Matrix') -> dict[str, dict]:
         result = self.run_matrix(keywords=keywords, matrix=matrix)
         return matrix.add_info(cvs=self.cvs, results=result)
 
-    def export_results(self, keywords: 'Keywords', matrix_obj: 'Matrix' = None, bl: str = None,
-                       show: bool = False, runtype: str = 'semantic') -> dict[str, dict]:
+    def export_results(self, keywords: 'Keywords', matrix_obj: 'Matrix' = None, bl: str | list[str] = None,
+                       show: bool = False, runtype: str = 'semantic', frequency: bool = False, k: int = None,
+                       threshold: float = None, fields: list[str] = None,
+                       include_body: bool = False) -> dict[str, dict]:
         if show:
             match runtype:
                 case 'semantic':
-                    return self.compile_person(keywords)
+                    return self.compile_person(keywords, bl, k=k, threshold=threshold, fields=fields,
+                                               include_body=include_body)
                 case 'logic':
-                    return self.compile_person(keywords, bl, runtype=runtype)
+                    return self.compile_person(keywords, bl, runtype=runtype, frequency=frequency, k=k,
+                                               threshold=threshold, fields=fields, include_body=include_body)
                 case 'matrix':
                     return self.compile_matrix(keywords=keywords, matrix=matrix_obj)
@@ -1,7 +1,8 @@
+from components.embedding_cache import embedding_cache
 from components.logger import logger
 from components.constants import BertModel
+from components.matcher import KeywordMatcher
 
-from sentence_transformers import SentenceTransformer
 import pickle
 import json
 
@@ -31,17 +32,20 @@ class Keywords:
         Returns the weights of the keywords.
     get_words():
         Returns the keywords.
+    get_matcher():
+        Returns the KeywordMatcher of the keywords, compiled once.
     update_weights(word: str, weight: float):
         Updates the weight of a keyword.
     update_words(old_word: str, new_word: str):
         Updates a keyword.
     """
-    def __init__(self, words: list[str], weights: list[float]) -> None:
+    def __init__(self, words: list[str], weights: list[float], encoder: 'EmbeddingCache' = embedding_cache) -> None:
         self.bert_model = BertModel.GTE_LARGE
-        embedding_model = SentenceTransformer(self.bert_model.value)
-        self.embedded_words = {word: {'embedding': embedding_model.encode(word).tolist(),
-                                      'weight': weight} for word, weight in zip(words, weights)}
+        embeddings = encoder.encode(list(words), self.bert_model)
+        self.embedded_words = {word: {'embedding': embedding.tolist(),
+                                      'weight': weight} for word, embedding, weight in zip(words, embeddings, weights)}
         self.weights = weights
+        self._matcher = None
 
     def __len__(self) -> int:
         return len(self.embedded_words)
@@ -65,8 +69,9 @@ class Keywords:
         """
         if word:
             if word not in self.embedded_words:
-                embedding_model = SentenceTransformer(self.bert_model.value)
-                self.embedded_words.update({word: {'embedding': embedding_model.encode(word), 'weight': weight}})
+                embedding = embedding_cache.encode([word], self.bert_model)[0]
+                self.embedded_words.update({word: {'embedding': embedding.tolist(), 'weight': weight}})
+                self._matcher = None
                 return self.embedded_words[word]['embedding']
             else:
                 logger.error(f"Word {word} already present in the collection")
@@ -79,6 +84,17 @@ class Keywords:
     def get_words(self) -> list[str]:
         return list(self.embedded_words.keys())
 
+    def get_matcher(self) -> 'KeywordMatcher':
+        """
+        Return the multi-pattern matcher of the keywords, compiled on the first call and reused until the
+        keywords change.
+
+        :return: the KeywordMatcher of the keywords
+        """
+        if getattr(self, '_matcher', None) is None:
+            self._matcher = KeywordMatcher(self.get_words())
+        return self._matcher
+
     def update_weights(self, word: str, weight: float) -> None:
         """
         Update the weight of a keyword.
@@ -105,6 +121,7 @@ class Keywords:
             _ = self.get_embedded_word(new_word, self.embedded_words[old_word]['weight'])
             logger.debug(f"Updating word from {old_word} to {new_word}")
             del self.embedded_words[old_word]
+            self._matcher = None
 
     @classmethod
     def load(cls, filename: str) -> 'Keywords':
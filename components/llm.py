@@ -1,15 +1,139 @@
+from components.lru import LRUCache
 from components.cv import CVperson
 
 from abc import ABC, abstractmethod
+from typing import Union, Callable, Iterator
 from openai import OpenAI
-from typing import Union
+import threading
+import hashlib
 import json
+import time
+import os
+
+
+class ResponseCache(LRUCache):
+    """
+    A class to cache the responses of the LLM models, so the same prompt is paid only once.
+
+    ...
+
+    The responses are kept in a bounded LRUCache keyed by the model, the temperature and the SHA-256 hash of the
+    prompt, and they expire after ttl seconds. A cached response is returned with 0 tokens used, and the tokens of
+    the original call are counted as saved. A miss is counted every time the model is called, whether its answer is
+    stored or not. The cache can be saved to disk and loaded at the next start.
+
+    Attributes
+    ----------
+    maxsize : int
+        the maximum number of responses kept
+    ttl : float
+        the seconds a response stays valid
+    path : str
+        the file where the cache is persisted, None to keep it only in memory
+    hits : int
+        the number of prompts served from the cache
+    misses : int
+        the number of prompts sent to the model
+    saved_input_tokens : int
+        the input tokens not paid thanks to the cache
+    saved_output_tokens : int
+        the output tokens not paid thanks to the cache
+
+    Methods
+    -------
+    get_response(model: str, temperature: float, message: str, call: Callable[[str], tuple],
+                 accept: Callable[[str], bool] = None) -> (str, int, int):
+        Returns the cached response of the prompt, calling the model only when it is missing or expired.
+    lookup(model: str, temperature: float, message: str, accept: Callable[[str], bool] = None) -> str | None:
+        Returns the cached answer of the prompt, None when it is missing, expired or rejected.
+    record_miss() -> None:
+        Counts a prompt sent to the model.
+    store(model: str, temperature: float, message: str, answer: str, input_tokens: int, output_tokens: int) -> None:
+        Stores the answer of the prompt.
+    get_stats() -> dict:
+        Returns the size, the hit rate and the saved tokens of the cache.
+    save(path: str = None), load(path: str = None):
+        Inherited from LRUCache, only the responses not expired are saved and loaded.
+    """
+    label = 'LLM response cache'
+
+    def __init__(self, maxsize: int = 2000, ttl: float = 7 * 24 * 3600, path: str = None):
+        self.ttl = ttl
+        self.saved_input_tokens = 0
+        self.saved_output_tokens = 0
+        super().__init__(maxsize=maxsize, path=path)
+
+    @staticmethod
+    def make_key(model: str, temperature: float, message: str) -> tuple:
+        return model, temperature, hashlib.sha256(message.encode('utf-8')).hexdigest()
+
+    def is_valid(self, entry: tuple) -> bool:
+        return time.time() - entry[0] <= self.ttl
+
+    def get_response(self, model: str, temperature: float, message: str, call: Callable[[str], tuple],
+                     accept: Callable[[str], bool] = None) -> (str, int, int):
+        """
+        Return the response of the prompt from the cache, or call the model and store its response.
+
+        :param model: the name of the model
+        :param temperature: the temperature of the model
+        :param message: the prompt
+        :param call: the function sending the prompt to the model and returning (answer, input tokens, output tokens)
+        :param accept: the function checking the answer, the answers it rejects are neither stored nor served from
+            the cache, so the next request calls the model again [optional]
+
+        :return: the answer with the input and output tokens used, 0 when the answer comes from the cache
+        """
+        answer = self.lookup(model, temperature, message, accept=accept)
+        if answer is not None:
+            return answer, 0, 0
+
+        self.record_miss()
+        answer, input_tokens, output_tokens = call(message)
+        if accept is None or accept(answer):
+            self.store(model, temperature, message, answer, input_tokens, output_tokens)
+        return answer, input_tokens, output_tokens
+
+    def lookup(self, model: str, temperature: float, message: str,
+               accept: Callable[[str], bool] = None) -> Union[str, None]:
+        key = self.make_key(model, temperature, message)
+        with self._lock:
+            entry = self._get(key)
+            if entry is None or (accept is not None and not accept(entry[1])):
+                return None
+            self.hits += 1
+            self.saved_input_tokens += entry[2]
+            self.saved_output_tokens += entry[3]
+            return entry[1]
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def store(self, model: str, temperature: float, message: str, answer: str, input_tokens: int,
+              output_tokens: int) -> None:
+        key = self.make_key(model, temperature, message)
+        with self._lock:
+            self._put(key, (time.time(), answer, input_tokens, output_tokens))
+
+    def get_stats(self) -> dict:
+        return {**super().get_stats(),
+                'saved_input_tokens': self.saved_input_tokens,
+                'saved_output_tokens': self.saved_output_tokens}
+
+
+response_cache = ResponseCache(maxsize=int(os.getenv('LLM_CACHE_SIZE', 2000)),
+                               ttl=float(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600)),
+                               path=os.getenv('LLM_CACHE_PATH'))
+
 
 class LLM(ABC):
-    def __init__(self, api_key: str, model: str, temperature: float = 0.0):
+    def __init__(self, api_key: str, model: str, temperature: float = 0.0,
+                 cache: Union['ResponseCache', None] = response_cache):
         self.api_key = api_key
         self.model = model
         self.temperature = temperature
+        self.cache = cache
 
     def get_model_name(self) -> str:
         return self.model
@@ -22,21 +146,74 @@ class LLM(ABC):
     def update_api_key(self, api_key: str) -> None:
         pass
 
+    def get_response_stream(self, message: str) -> Iterator[str]:
+        """
+        Yield the answer of the model piece by piece, the models without streaming yield the whole answer at once.
+
+        :param message: the prompt
+
+        :return: iterator of the pieces of the answer, returning (input tokens, output tokens) when exhausted
+        """
+        output_message, input_token, output_token = self.get_response(message)
+        yield output_message
+        return input_token, output_token
+
+    def get_cached_response(self, message: str, accept: Callable[[str], bool] = None) -> (str, int, int):
+        if self.cache is None:
+            return self.get_response(message)
+        return self.cache.get_response(model=self.model, temperature=self.temperature, message=message,
+                                       call=self.get_response, accept=accept)
+
+    def get_cached_response_stream(self, message: str) -> Iterator[str]:
+        answer = self.cache.lookup(self.model, self.temperature, message) if self.cache is not None else None
+        if answer is not None:
+            yield answer
+            return
+        if self.cache is not None:
+            self.cache.record_miss()
+        pieces = []
+        stream = self.get_response_stream(message)
+        try:
+            while True:
+                try:
+                    piece = next(stream)
+                except StopIteration as stop:
+                    input_token, output_token = stop.value or (0, 0)
+                    break
+                pieces.append(piece)
+                yield piece
+        finally:
+            stream.close()
+        if self.cache is not None and ''.join(pieces).strip():
+            self.cache.store(self.model, self.temperature, message, ''.join(pieces), input_token, output_token)
+
     def get_answer(self, cv_selected: 'CVperson') -> (str, int, int):
         input_message = self.get_message(cv=cv_selected)
-        output_message, input_token, output_token = self.get_response(input_message)
+        output_message, input_token, output_token = self.get_cached_response(input_message)
         return output_message, input_token, output_token
 
+    def get_answer_stream(self, cv_selected: 'CVperson') -> Iterator[str]:
+        input_message = self.get_message(cv=cv_selected)
+        yield from self.get_cached_response_stream(input_message)
+
     def get_answer_india(self, cv_text: str) -> (str, int, int):
         input_message = self.get_message_india(cv=cv_text)
-        output_message, input_token, output_token = self.get_response(input_message)
+        output_message, input_token, output_token = self.get_cached_response(input_message)
         return output_message, input_token, output_token
 
     def get_skill(self, jobpost_txt: str) -> (str, int, int):
         input_message = self.get_skill_requested(jobpost=jobpost_txt)
-        output_message, input_token, output_token = self.get_response(input_message)
+        output_message, input_token, output_token = self.get_cached_response(input_message, accept=self.is_json)
         return output_message, input_token, output_token
 
+    @staticmethod
+    def is_json(answer: str) -> bool:
+        try:
+            json.loads(answer)
+            return True
+        except (TypeError, ValueError):
+            return False
+
     @staticmethod
     def get_message(cv: 'CVperson') -> str:
         # message = f"Extract the areas of competence from this person\'s CV. The areas of competence must be for which the person is an expert. There must be a maximum of 6 areas, order them from most important to least important based on the information in the CV: {cv.get_body()}\n"
@@ -56,8 +233,9 @@ class LLM(ABC):
 
 class GptLLM(LLM):
 
-    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo-0125", temperature: float = 0.0):
-        super().__init__(api_key=api_key, model=model, temperature=temperature)
+    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo-0125", temperature: float = 0.0,
+                 cache: Union['ResponseCache', None] = response_cache):
+        super().__init__(api_key=api_key, model=model, temperature=temperature, cache=cache)
         self.client = OpenAI(api_key=api_key)
 
     def get_response(self, message: str) -> (str, int, int):
@@ -73,9 +251,151 @@ class GptLLM(LLM):
         )
         return response.choices[0].message.content, response.usage.prompt_tokens, response.usage.completion_tokens
 
+    def get_response_stream(self, message: str) -> Iterator[str]:
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": message
+                },
+            ],
+            temperature=self.temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        input_token, output_token = 0, 0
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if chunk.usage is not None:
+                    input_token, output_token = chunk.usage.prompt_tokens, chunk.usage.completion_tokens
+        finally:
+            stream.close()
+        return input_token, output_token
+
     def update_api_key(self, api_key: str) -> None:
         if len(api_key) == 51 and api_key.startswith("sk-"):
             self.api_key = api_key
             self.client = OpenAI(api_key=api_key)
         else:
             raise ValueError(f"API key not valid for {self.model}")
+
+
+class LocalLLM(GptLLM):
+    """
+    A class to use a local server exposing the OpenAI chat completions API (vLLM, llama.cpp, Ollama, ...).
+
+    ...
+
+    It is a GptLLM with the client pointed to the base_url of the local server, so the prompts, the streaming and
+    the response cache are the same of the OpenAI models. The local servers do not check the API key.
+
+    Attributes
+    ----------
+    base_url : str
+        the URL of the OpenAI-compatible API of the local server
+    """
+    def __init__(self, api_key: str = None, model: str = "local", temperature: float = 0.0,
+                 base_url: str = "http://localhost:8000/v1", cache: Union['ResponseCache', None] = response_cache):
+        self.base_url = base_url
+        super().__init__(api_key=api_key or "local", model=model, temperature=temperature, cache=cache)
+        self.client = OpenAI(api_key=self.api_key, base_url=base_url)
+
+    def update_api_key(self, api_key: str) -> None:
+        self.api_key = api_key
+        self.client = OpenAI(api_key=api_key, base_url=self.base_url)
+
+
+class FakeLLM(LLM):
+    """
+    A class to replace the LLM models with a deterministic offline stand-in, for load tests and benchmarks.
+
+    ...
+
+    The answer depends only on the prompt: the skill extraction prompts get a JSON answer with the longest words of
+    the job post, the other prompts get output_tokens words derived from the hash of the prompt. Each call waits
+    latency seconds, and the streaming waits token_latency seconds between two words, so the throughput of /names/,
+    /extract/ and of the summary job can be measured without network calls.
+
+    Attributes
+    ----------
+    latency : float
+        the seconds waited before the answer, or before the first word of the stream
+    token_latency : float
+        the seconds waited between two words of the stream
+    output_tokens : int
+        the number of words of the answers
+    calls : int
+        the number of prompts answered
+    """
+    WORDS = ["validation", "compliance", "quality", "regulatory", "engineering", "laboratory", "pharmacovigilance",
+             "audit", "documentation", "risk", "process", "clinical", "manufacturing", "data", "integrity", "GMP"]
+
+    def __init__(self, api_key: str = None, model: str = "fake", temperature: float = 0.0, latency: float = 0.5,
+                 token_latency: float = 0.0, output_tokens: int = 200, cache: Union['ResponseCache', None] = None):
+        super().__init__(api_key=api_key, model=model, temperature=temperature, cache=cache)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.output_tokens = output_tokens
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _answer(self, message: str) -> list[str]:
+        skill_prompt = self.get_skill_requested(jobpost="").rstrip("\n")
+        if message.startswith(skill_prompt):
+            words = dict.fromkeys(word.strip(".,;:()") for word in message[len(skill_prompt):].split())
+            skills = sorted((word for word in words if len(word) > 6), key=lambda word: (-len(word), word))[:8]
+            return [json.dumps({'skills': skills})]
+        seed = hashlib.sha256(message.encode('utf-8')).digest()
+        return [self.WORDS[seed[i % len(seed)] % len(self.WORDS)] + ("\n" if i % 12 == 11 else " ")
+                for i in range(self.output_tokens)]
+
+    def _count(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def get_response(self, message: str) -> (str, int, int):
+        time.sleep(self.latency)
+        self._count()
+        answer = self._answer(message)
+        return ''.join(answer), len(message) // 4, len(answer)
+
+    def get_response_stream(self, message: str) -> Iterator[str]:
+        time.sleep(self.latency)
+        self._count()
+        answer = self._answer(message)
+        for i, word in enumerate(answer):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield word
+        return len(message) // 4, len(answer)
+
+    def update_api_key(self, api_key: str) -> None:
+        self.api_key = api_key
+
+
+def create_llm(model: str = "gpt-3.5-turbo-0125", backend: str = None, **kwargs) -> 'LLM':
+    """
+    Create the LLM model of the backend selected by the LLM_BACKEND environment variable: 'openai' (default),
+    'local' for an OpenAI-compatible server at LOCAL_LLM_URL serving LOCAL_LLM_MODEL, or 'fake' for the offline
+    stand-in with FAKE_LLM_LATENCY seconds of latency and FAKE_LLM_OUTPUT_TOKENS words per answer.
+
+    :param model: the name of the OpenAI model
+    :param backend: the backend to use, default is the LLM_BACKEND environment variable
+    :param kwargs: the other arguments of the LLM class
+
+    :return: the LLM model
+    """
+    backend = backend or os.getenv('LLM_BACKEND', 'openai')
+    match backend:
+        case 'openai':
+            return GptLLM(api_key=os.getenv('API_KEY'), model=model, **kwargs)
+        case 'local':
+            return LocalLLM(api_key=os.getenv('LOCAL_LLM_API_KEY'), model=os.getenv('LOCAL_LLM_MODEL', model),
+                            base_url=os.getenv('LOCAL_LLM_URL', "http://localhost:8000/v1"), **kwargs)
+        case 'fake':
+            return FakeLLM(model=f"fake-{model}", latency=float(os.getenv('FAKE_LLM_LATENCY', 0.5)),
+                           output_tokens=int(os.getenv('FAKE_LLM_OUTPUT_TOKENS', 200)), **kwargs)
+    raise ValueError(f"LLM backend not valid: {backend}")
@@ -0,0 +1,138 @@
+from components.logger import logger
+
+from collections import OrderedDict
+from typing import Hashable, Any
+import threading
+import pickle
+import os
+
+
+class LRUCache:
+    """
+    A class to represent a bounded LRU cache, thread safe and persisted on disk, shared by the caches of the project.
+
+    ...
+
+    The entries are kept in an OrderedDict from the least to the most recently used, the least recently used ones
+    are dropped when the cache is full. The subclasses define what an entry is and when it is still valid, and
+    count the hits and the misses of their own requests. The cache can be saved to disk and loaded at the next start.
+
+    Attributes
+    ----------
+    label : str
+        the name of the cache in the log messages
+    maxsize : int
+        the maximum number of entries kept
+    path : str
+        the file where the cache is persisted, None to keep it only in memory
+    hits : int
+        the number of requests served from the cache
+    misses : int
+        the number of requests computed again
+
+    Methods
+    -------
+    is_valid(entry: Any) -> bool:
+        Returns True if the entry can still be served, the subclasses add their expiration rules.
+    get_stats() -> dict:
+        Returns the size and the hit/miss statistics of the cache.
+    save(path: str = None) -> None:
+        Saves the valid entries to disk.
+    load(path: str = None) -> None:
+        Loads the valid entries from disk.
+    """
+    label = 'cache'
+
+    def __init__(self, maxsize: int, path: str = None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def is_valid(self, entry: Any) -> bool:
+        return True
+
+    def _get(self, key: Hashable) -> Any:
+        """
+        Return the entry of the key marking it as the most recently used, the caller holds the lock.
+
+        :param key: the key of the entry
+
+        :return: the entry, None when it is missing or not valid
+        """
+        entry = self._cache.get(key)
+        if entry is None or not self.is_valid(entry):
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _put(self, key: Hashable, entry: Any) -> None:
+        """
+        Store the entry of the key as the most recently used, dropping the least recently used entries when the
+        cache is full. The caller holds the lock.
+
+        :param key: the key of the entry
+        :param entry: the entry to store
+
+        :return: nothing
+        """
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'size': len(self._cache),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None}
+
+    def save(self, path: str = None) -> None:
+        """
+        Save the valid entries to disk, writing a temporary file and renaming it.
+
+        :param path: the file where to save the cache, default is the path of the cache
+
+        :return: nothing
+        """
+        path = path or self.path
+        if path is None:
+            return
+        with self._lock:
+            items = [(key, entry) for key, entry in self._cache.items() if self.is_valid(entry)]
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(items, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            logger.info(f"Saved the {self.label} to {path} with {len(items)} entries")
+        except (OSError, pickle.PickleError) as e:
+            logger.error(f"Error saving the {self.label} to {path}: {e}")
+
+    def load(self, path: str = None) -> None:
+        """
+        Load the valid entries from disk, keeping the most recent ones up to maxsize.
+
+        :param path: the file from which to load the cache, default is the path of the cache
+
+        :return: nothing
+        """
+        path = path or self.path
+        try:
+            with open(path, 'rb') as f:
+                items = pickle.load(f)
+            with self._lock:
+                self._cache = OrderedDict((key, entry) for key, entry in items[-self.maxsize:]
+                                          if self.is_valid(entry))
+            logger.info(f"Loaded the {self.label} from {path} with {len(self._cache)} entries")
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.error(f"Error loading the {self.label} from {path}: {e}")
@@ -0,0 +1,101 @@
+from collections import deque
+from typing import Iterator
+
+
+class KeywordMatcher:
+    """
+    A class to find many keywords in a text with a single pass, using an Aho-Corasick automaton.
+
+    ...
+
+    The automaton is compiled once from the lowercased keywords and then reports every keyword occurrence in a
+    lowercased text, overlapping ones included, so the presence of a keyword is the same of the `in` test of
+    CVperson.find_in_text and the counts can be used for frequency-weighted scores.
+
+    Attributes
+    ----------
+    words : list[str]
+        the keywords of the automaton, without duplicates
+
+    Methods
+    -------
+    find_all(text: str) -> Iterator[tuple[int, str]]:
+        Yields the start position and the keyword of each occurrence in the text.
+    find(text: str, positions: bool = False) -> dict[str, int | list[int]]:
+        Returns the number of occurrences, or their start positions, of each keyword in the text.
+    match(text: str) -> dict[str, int]:
+        Returns 1 or 0 for the presence of each keyword in the text.
+    """
+    def __init__(self, words: list[str]):
+        self.words = list(dict.fromkeys(words))
+        self._lengths = [len(word.lower()) for word in self.words]
+        self._empty = [i for i, length in enumerate(self._lengths) if length == 0]
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for i, word in enumerate(self.words):
+            node = 0
+            for char in word.lower():
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][char] = next_node
+                node = next_node
+            if node:
+                self._out[node].append(i)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self._goto[node].items():
+                queue.append(next_node)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_node] = self._goto[fail].get(char, 0)
+                self._out[next_node] = self._out[next_node] + self._out[self._fail[next_node]]
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def find_all(self, text: str) -> Iterator[tuple[int, str]]:
+        """
+        Scan the lowercased text once and yield every occurrence of the keywords.
+
+        :param text: the text where to search the keywords
+
+        :return: iterator of (start position in the lowercased text, keyword) for each occurrence
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for position, char in enumerate(text.lower()):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for i in out[node]:
+                yield position - self._lengths[i] + 1, self.words[i]
+
+    def find(self, text: str, positions: bool = False) -> dict[str, int | list[int]]:
+        """
+        Count the occurrences of each keyword in the text, or collect their start positions.
+
+        :param text: the text where to search the keywords
+        :param positions: boolean to return the list of the start positions instead of the counts
+
+        :return: dictionary with the count, or the list of start positions, of each keyword
+        """
+        found = {word: [] for word in self.words}
+        for start, word in self.find_all(text):
+            found[word].append(start)
+        for i in self._empty:
+            found[self.words[i]] = [0]
+        if positions:
+            return found
+        return {word: len(starts) for word, starts in found.items()}
+
+    def match(self, text: str) -> dict[str, int]:
+        return {word: 1 if count else 0 for word, count in self.find(text).items()}
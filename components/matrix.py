@@ -1,11 +1,11 @@
+from components.embedding_cache import embedding_cache
+from components.fragments import FragmentMatrix
 from components.constants import BertModel
 from components.keywords import Keywords
 from components.logger import logger
 from components.cvs import CVS
 
 from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
-from tqdm import tqdm
 import pandas as pd
 import numpy as np
 import pickle
@@ -17,8 +17,8 @@ class Matrix:
         data = pd.read_excel(file_Excel, header=3)
         self.data = self._clean_table(data, exe_scale=exe_scale)
         self.bert_model = BertModel.GTE_LARGE
-        embedding_model = SentenceTransformer(self.bert_model.value)
-        self.embedding_map = self._create_embedding_map(model=embedding_model)
+        self.embedding_map = self._create_embedding_map()
+        self.columns, self.embedding_matrix = self._create_embedding_matrix()
 
     def __str__(self):
         return f''' Matrix Object: {self.data.shape} \n
@@ -49,19 +49,75 @@ class Matrix:
 
         return data
 
-    def _create_embedding_map(self, model: 'SentenceTransformer') -> dict[str, list[float]]:
-        embedding_map = {}
+    def _create_embedding_map(self) -> dict[str, list[float]]:
+        columns = [str(col) for col in self.data.columns]
+        embeddings = embedding_cache.encode(columns, self.bert_model)
+        return {col: embedding.tolist() for col, embedding in zip(self.data.columns, embeddings)}
+
+    def _create_embedding_matrix(self) -> (list[str], 'np.ndarray'):
+        return list(self.embedding_map.keys()), FragmentMatrix.normalize(list(self.embedding_map.values()))
+
+    def get_embedding_matrix(self) -> (list[str], 'np.ndarray'):
+        """
+        Return the names of the columns and the normalized float32 matrix of their embeddings, one row per column.
+        The matrices saved before the matrix was stored build it from the embedding map on the first call.
+
+        :return: the list of column names and the matrix (n_columns, dim)
+        """
+        if getattr(self, 'embedding_matrix', None) is None:
+            self.columns, self.embedding_matrix = self._create_embedding_matrix()
+        return self.columns, self.embedding_matrix
+
+    def resolve(self, embeddings: list[list[float]], top_k: int = 1) -> list[list[tuple[str, float]]]:
+        """
+        Find the columns of the Matrix most similar to each embedding with a single matrix product.
+
+        :param embeddings: list of float list values representing the keyword embeddings
+        :param top_k: the number of candidate columns to return for each keyword
+
+        :return: for each keyword, the list of the top_k (column, similarity) sorted by similarity
+        """
+        if len(embeddings) == 0:
+            return []
+        columns, embedding_matrix = self.get_embedding_matrix()
+        similarities = FragmentMatrix.normalize(embeddings) @ embedding_matrix.T
+        return [[(columns[col], score) for _, col, score in candidates]
+                for candidates in self._top_k(similarities, top_k)]
 
-        pbar = tqdm(total=len(self.data.columns), desc='Embedding Skills', ascii=True)
-        for col in self.data.columns:
-            embedding_map[col] = self._embed(model=model, skill=col)
-            pbar.update(1)
-        pbar.close()
-        return embedding_map
+    @staticmethod
+    def resolve_many(matrices: dict[str, 'Matrix'], embeddings: list[list[float]],
+                     top_k: int = 1) -> list[list[tuple[str, str, float]]]:
+        """
+        Find the columns most similar to each embedding among all the given matrices at once.
+
+        :param matrices: dictionary of the Matrix objects by CoE name
+        :param embeddings: list of float list values representing the keyword embeddings
+        :param top_k: the number of candidate columns to return for each keyword
+
+        :return: for each keyword, the list of the top_k (CoE name, column, similarity) sorted by similarity
+        """
+        if len(embeddings) == 0 or not matrices:
+            return [[] for _ in embeddings]
+        names, columns, blocks = [], [], []
+        for name, matrix_obj in matrices.items():
+            matrix_columns, embedding_matrix = matrix_obj.get_embedding_matrix()
+            names.extend([name] * len(matrix_columns))
+            columns.extend(matrix_columns)
+            blocks.append(embedding_matrix)
+        similarities = FragmentMatrix.normalize(embeddings) @ np.vstack(blocks).T
+        return [[(names[col], columns[col], score) for _, col, score in candidates]
+                for candidates in Matrix._top_k(similarities, top_k)]
 
     @staticmethod
-    def _embed(model: 'SentenceTransformer', skill: str) -> list[float]:
-        return model.encode(skill).tolist()
+    def _top_k(similarities: 'np.ndarray', top_k: int) -> list[list[tuple[int, int, float]]]:
+        top_k = min(top_k, similarities.shape[1])
+        if top_k == 1:
+            best = similarities.argmax(axis=1)[:, None]
+        else:
+            best = np.argpartition(-similarities, top_k - 1, axis=1)[:, :top_k]
+            order = np.argsort(-np.take_along_axis(similarities, best, axis=1), axis=1, kind='stable')
+            best = np.take_along_axis(best, order, axis=1)
+        return [[(row, int(col), float(similarities[row, col])) for col in cols] for row, cols in enumerate(best)]
 
     def get_data(self) -> 'pd.DataFrame':
         return self.data
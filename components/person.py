@@ -62,3 +62,16 @@ class Person:
                    indirizzo_residenza=info_dict['indirizzo_residenza'],
                    business_line=info_dict['business_line'],
                    stato=info_dict['type'])
+
+    @classmethod
+    def load_from_record(cls, record: dict) -> 'Person':
+        """
+        Rebuild a Person from the dictionary returned by to_dict, where the resume date is already formatted.
+
+        :param record: the dictionary of the Person attributes
+
+        :return: the Person object
+        """
+        person = cls.__new__(cls)
+        person.__dict__.update(record)
+        return person
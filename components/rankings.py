@@ -0,0 +1,101 @@
+from components.logger import logger
+
+from typing import Callable, Hashable
+import threading
+
+
+class RankingCache:
+    """
+    A class to store the rankings that depend only on the archive, like the CoE rankings of the Ontologic search.
+
+    ...
+
+    Each ranking is stored together with the identity of the archive it was computed on: only invalidate moves the
+    cache to a new archive identity and drops the stored rankings. A request carrying another identity, like a
+    request started before a swap, gets its ranking computed without being stored.
+
+    Attributes
+    ----------
+    identity : Hashable
+        the identity of the archive of the stored rankings
+
+    Methods
+    -------
+    peek(name: str, identity: Hashable) -> dict | None:
+        Returns the stored ranking without waiting, None if it is not computed yet.
+    get(name: str, identity: Hashable, compute: Callable[[], dict]) -> dict:
+        Returns the stored ranking, computing it on the first request.
+    warm(identity: Hashable, computes: dict[str, Callable[[], dict]]) -> None:
+        Computes all the given rankings in advance, stopping when the archive identity changes.
+    invalidate(identity: Hashable) -> None:
+        Drops all the stored rankings and moves the cache to the new archive identity.
+    """
+    def __init__(self):
+        self.identity = None
+        self._rankings = {}
+        self._lock = threading.Lock()
+        self._computing = {}
+
+    def peek(self, name: str, identity: Hashable) -> dict | None:
+        with self._lock:
+            return self._rankings.get(name) if identity == self.identity else None
+
+    def get(self, name: str, identity: Hashable, compute: Callable[[], dict]) -> dict:
+        """
+        Return the ranking stored for the archive identity, computing it once if it is missing.
+
+        :param name: the name of the ranking
+        :param identity: the identity of the archive the caller is searching
+        :param compute: the function computing the ranking
+
+        :return: the ranking
+        """
+        with self._lock:
+            stale = identity != self.identity
+            if not stale:
+                if name in self._rankings:
+                    return self._rankings[name]
+                name_lock = self._computing.setdefault(name, threading.Lock())
+        if stale:
+            # the archive was swapped after the request started: answer it without touching the current rankings
+            return compute()
+
+        with name_lock:
+            with self._lock:
+                if identity == self.identity and name in self._rankings:
+                    return self._rankings[name]
+            ranking = compute()
+            with self._lock:
+                if identity == self.identity:
+                    self._rankings[name] = ranking
+                    logger.info(f"Ranking {name} stored for the archive {identity}")
+        return ranking
+
+    def warm(self, identity: Hashable, computes: dict[str, Callable[[], dict]]) -> None:
+        """
+        Compute in advance all the rankings for the archive identity, stopping as soon as the archive is swapped.
+
+        :param identity: the identity of the current archive
+        :param computes: dictionary of the functions computing the rankings by name
+
+        :return: nothing
+        """
+        for name, compute in computes.items():
+            if identity != self.identity:
+                logger.info(f"Rankings precomputation stopped, the archive {identity} was swapped")
+                return
+            self.get(name=name, identity=identity, compute=compute)
+        logger.info(f"{len(computes)} rankings precomputed for the archive {identity}")
+
+    def invalidate(self, identity: Hashable) -> None:
+        """
+        Drop all the stored rankings and store the next ones for the new archive identity.
+
+        :param identity: the identity of the archive now served
+
+        :return: nothing
+        """
+        with self._lock:
+            self._rankings = {}
+            self._computing = {}
+            self.identity = identity
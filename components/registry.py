@@ -0,0 +1,120 @@
+from components.constants import BertModel
+from components.logger import logger
+
+from sentence_transformers import SentenceTransformer
+from transformers import AutoTokenizer
+import threading
+import torch
+import time
+import os
+
+
+class ModelRegistry:
+    """
+    A class to share the embedding models and tokenizers across the whole process.
+
+    ...
+
+    Each model and tokenizer is loaded the first time it is requested and then served from memory, so CVs,
+    Keywords and Matrices do not reload the weights from disk on every object creation.
+
+    Attributes
+    ----------
+    models : dict[BertModel, SentenceTransformer]
+        the SentenceTransformer models already loaded
+    tokenizers : dict[BertModel, AutoTokenizer]
+        the tokenizers already loaded
+    load_times : dict[str, float]
+        seconds spent loading each model and tokenizer
+
+    Methods
+    -------
+    get_model(bert_model: BertModel) -> SentenceTransformer:
+        Returns the shared model, loading it on the first call.
+    get_tokenizer(bert_model: BertModel) -> AutoTokenizer:
+        Returns the shared tokenizer, loading it on the first call.
+    warm_up(bert_models: list[BertModel]) -> None:
+        Loads the models and tokenizers and runs a first encoding to initialize them.
+    get_stats() -> dict:
+        Returns the load times and the memory used by the loaded models.
+    """
+    def __init__(self) -> None:
+        self.models = {}
+        self.tokenizers = {}
+        self.load_times = {}
+        self._lock = threading.Lock()
+
+    def get_model(self, bert_model: 'BertModel' = BertModel.GTE_LARGE) -> 'SentenceTransformer':
+        """
+        Return the SentenceTransformer model for the given BertModel, loading it only once per process.
+
+        :param bert_model: the BertModel constant of the model to return
+
+        :return: the shared SentenceTransformer model
+        """
+        model = self.models.get(bert_model)
+        if model is None:
+            with self._lock:
+                model = self.models.get(bert_model)
+                if model is None:
+                    start_time = time.time()
+                    if os.getenv('TORCH_NUM_THREADS'):
+                        torch.set_num_threads(int(os.getenv('TORCH_NUM_THREADS')))
+                    model = SentenceTransformer(bert_model.value)
+                    self.load_times[f"model:{bert_model.value}"] = time.time() - start_time
+                    self.models[bert_model] = model
+                    logger.info(f"Model {bert_model.value} loaded in {self.load_times[f'model:{bert_model.value}']:.2f}s")
+        return model
+
+    def get_tokenizer(self, bert_model: 'BertModel' = BertModel.GTE_LARGE) -> 'AutoTokenizer':
+        """
+        Return the tokenizer for the given BertModel, loading it only once per process.
+
+        :param bert_model: the BertModel constant of the tokenizer to return
+
+        :return: the shared tokenizer
+        """
+        tokenizer = self.tokenizers.get(bert_model)
+        if tokenizer is None:
+            with self._lock:
+                tokenizer = self.tokenizers.get(bert_model)
+                if tokenizer is None:
+                    start_time = time.time()
+                    tokenizer = AutoTokenizer.from_pretrained(bert_model.value)
+                    self.load_times[f"tokenizer:{bert_model.value}"] = time.time() - start_time
+                    self.tokenizers[bert_model] = tokenizer
+                    logger.info(f"Tokenizer {bert_model.value} loaded")
+        return tokenizer
+
+    def warm_up(self, bert_models: list['BertModel'] = None) -> None:
+        """
+        Load the models and tokenizers before the first request and run a first encoding on each model.
+
+        :param bert_models: the list of models to warm up, default is all the BertModel constants
+
+        :return: nothing
+        """
+        if bert_models is None:
+            bert_models = list(BertModel)
+        for bert_model in bert_models:
+            self.get_tokenizer(bert_model)
+            self.get_model(bert_model).encode("warm up")
+            logger.info(f"Model {bert_model.value} warmed up")
+
+    def get_stats(self) -> dict:
+        """
+        Return the statistics of the registry: loaded models, load times and parameters memory.
+
+        :return: dictionary with the statistics for each loaded model
+        """
+        stats = {}
+        for bert_model, model in list(self.models.items()):
+            memory = sum(param.numel() * param.element_size() for param in model.parameters())
+            stats[bert_model.value] = {'parameters_mb': round(memory / 1024 ** 2, 2),
+                                       'device': str(model.device),
+                                       'load_time': self.load_times.get(f"model:{bert_model.value}"),
+                                       'tokenizer_loaded': bert_model in self.tokenizers}
+        return stats
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,173 @@
+from components.logger import logger
+from components.jaeger import Jaeger
+from components.cvs import CVS
+
+from datetime import datetime
+from typing import Callable
+import threading
+import time
+
+
+class ArchiveState:
+    """
+    A class to hold together the archive served by the API and the objects computed on it.
+
+    ...
+
+    The handlers read the current state once at the start of a request and use only its attributes, so a request
+    that overlaps a reload works on one archive from start to end, and a swap replaces a single reference.
+
+    Attributes
+    ----------
+    cvs : CVS
+        the CVS object of the archive
+    jaeger : Jaeger
+        the Jaeger object searching the archive
+    identity : Hashable
+        the identity of the archive, used as the key of the cached rankings
+    """
+    def __init__(self, cvs: 'CVS'):
+        self.cvs = cvs
+        self.jaeger = Jaeger(cvs=cvs)
+        self.identity = cvs.get_identity()
+
+
+class ArchiveReloader:
+    """
+    A class to replace the CV archive served by the API with the most recent one, without restarting the service.
+
+    ...
+
+    The new archive is loaded in a background thread, together with its fragment matrix and text index, while the
+    current one keeps serving the requests. Only when everything is ready the new CVS object is handed to the
+    on_swap callback, which replaces the state used by the handlers and invalidates the dependent caches.
+    A watcher thread can check periodically for a new archive, or the reload can be triggered on demand. Only the
+    columnar archives are reloaded: their folders get the final name when the writer has finished them, and they
+    are opened read-only, so the workers never write the archive they reload.
+
+    Attributes
+    ----------
+    cvs : CVS
+        the CVS object currently served
+    interval : float
+        the seconds between two checks of the watcher, 0 to disable it
+    reloads : int
+        the number of archives swapped in
+    last_reload : float
+        the timestamp of the last swap
+    last_error : str
+        the error of the last failed reload
+
+    Methods
+    -------
+    is_outdated() -> bool:
+        Returns True when a more recent archive than the served one is available.
+    reload(force: bool = False) -> bool:
+        Loads the most recent columnar archive and swaps it in.
+    trigger(force: bool = False) -> dict:
+        Starts a reload in the background.
+    start() -> None:
+        Starts the watcher thread.
+    stop() -> None:
+        Stops the watcher thread.
+    get_status() -> dict:
+        Returns the served archive and the statistics of the reloads.
+    """
+    def __init__(self, cvs: 'CVS', on_swap: Callable[['CVS'], None], interval: float = 0):
+        self.cvs = cvs
+        self.on_swap = on_swap
+        self.interval = interval
+        self.reloads = 0
+        self.last_reload = None
+        self.last_error = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    @staticmethod
+    def _stem(archive_name: str) -> str:
+        return archive_name[:-len(".pkl")] if archive_name and archive_name.endswith(".pkl") else archive_name
+
+    def _served_date(self) -> datetime | None:
+        try:
+            return datetime.strptime(self._stem(self.cvs.archive_name)[len("archive_"):], "%d_%m_%Y")
+        except (TypeError, ValueError):
+            return None
+
+    def is_outdated(self) -> bool:
+        newest = CVS.get_most_recent_archive()
+        if newest is None or newest[0] == self._stem(self.cvs.archive_name):
+            return False
+        served_date = self._served_date()
+        return served_date is None or newest[1] > served_date
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Load the most recent columnar archive with its indexes and swap it in, keeping the current one if the load
+        fails.
+
+        :param force: boolean to reload the archive even when it is the one already served
+
+        :return: True if a new archive has been swapped in
+        """
+        with self._reload_lock:
+            if not force and not self.is_outdated():
+                return False
+            start_time = time.time()
+            if CVS.get_most_recent_archive() is None:
+                self.last_error = "no complete columnar archive to reload"
+                logger.error(f"Reload of the archive skipped, {self.cvs.archive_name} is still served: "
+                             f"{self.last_error}")
+                return False
+            new_cvs = CVS()
+            try:
+                new_cvs.load_columnar()
+                if len(new_cvs) == 0:
+                    raise ValueError(f"the archive {new_cvs.archive_name} is empty or unreadable")
+                new_cvs.get_fragment_matrix()
+                new_cvs.get_text_index()
+                self.on_swap(new_cvs)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Reload of the archive failed, {self.cvs.archive_name} is still served: {e}")
+                return False
+
+            old_name, self.cvs = self.cvs.archive_name, new_cvs
+            self.reloads += 1
+            self.last_reload = time.time()
+            self.last_error = None
+            logger.info(f"Archive {new_cvs.archive_name} swapped in place of {old_name} "
+                        f"in {self.last_reload - start_time:.2f}s")
+            return True
+
+    def trigger(self, force: bool = False) -> dict:
+        if self._reload_lock.locked():
+            return {'status': 'reloading', **self.get_status()}
+        threading.Thread(target=self.reload, kwargs={'force': force}, name='archive-reload', daemon=True).start()
+        return {'status': 'started', **self.get_status()}
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Archive watcher error: {e}")
+
+    def start(self) -> None:
+        if self.interval and self._watcher is None:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name='archive-watcher', daemon=True)
+            self._watcher.start()
+            logger.info(f"Archive watcher started, checking every {self.interval}s")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._watcher = None
+
+    def get_status(self) -> dict:
+        return {'archive': self.cvs.archive_name,
+                'cvs': len(self.cvs),
+                'reloading': self._reload_lock.locked(),
+                'reloads': self.reloads,
+                'last_reload': self.last_reload,
+                'last_error': self.last_error}
@@ -1,14 +1,103 @@
+from components.logger import logger
 from components.cv import CVperson
 
 from datetime import datetime
+import threading
+import sqlite3
 import json
 import os
 
 
 class SummaryManager:
+    """
+    A class to store the LLM summaries of the resources in a SQLite database.
+
+    ...
+
+    Each summary is a row keyed by the resource name and the resume date, so saving a summary is a single upsert
+    whatever the number of summaries stored, and a new resume of the same resource gets its own row. The database
+    runs in WAL mode, so the API workers and the summary job read while another process writes. Each thread opens
+    its own connection. The first time the database is opened, the summaries of the legacy JSON file are imported.
+
+    Attributes
+    ----------
+    file_path : str
+        the path of the legacy JSON file of the summaries
+    db_path : str
+        the path of the SQLite database
+
+    Methods
+    -------
+    get_summary(resource_key: str, resume_date: str = None) -> str:
+        Returns the summary of the resume of the resource at that date, default is the most recent resume.
+    get_date(resource_key: str) -> str:
+        Returns the most recent resume date summarized for the resource.
+    check_keys(resource_name: str, resume_date: str) -> bool:
+        Returns True if the resume of the resource at that date has a summary.
+    check_infos(cv: CVperson) -> bool:
+        Returns True if the resume of the CV has a summary.
+    save_summary(cv: CVperson, summary: str) -> None:
+        Inserts or replaces the summary of the resume of the CV.
+    """
     def __init__(self, file_name: str):
         self.file_path = 'source/summaries/' + file_name
-        self.summary = self.load_summary_file()
+        self.db_path = os.path.splitext(self.file_path)[0] + '.db'
+        self._local = threading.local()
+        self._create_tables()
+        self._migrate_json()
+
+    def _connection(self) -> 'sqlite3.Connection':
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _create_tables(self) -> None:
+        connection = self._connection()
+        connection.execute("CREATE TABLE IF NOT EXISTS summaries ("
+                           "resource_name TEXT NOT NULL, "
+                           "resume_date TEXT NOT NULL, "
+                           "summary TEXT NOT NULL, "
+                           "created_at TEXT NOT NULL, "
+                           "PRIMARY KEY (resource_name, resume_date))")
+        connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _migrate_json(self) -> None:
+        """
+        Import once the summaries of the legacy JSON file, inside a write transaction so only one process does it.
+        The summaries with a missing or malformed resume date are skipped and logged.
+
+        :return: nothing
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if connection.execute("SELECT 1 FROM metadata WHERE key = 'json_migrated'").fetchone() is None:
+                try:
+                    summaries = self.load_summary_file()
+                except (OSError, ValueError) as e:
+                    # the migration is not recorded, so it is tried again once the file is fixed
+                    logger.error(f"Summaries of {self.file_path} not migrated, the file is unreadable: {e}")
+                    connection.execute("ROLLBACK")
+                    return
+                rows = []
+                for resource_name, item in summaries.items():
+                    try:
+                        rows.append((resource_name, self.normalize_date(item['resume_date']), item['summary'],
+                                     datetime.now().isoformat()))
+                    except (KeyError, TypeError, ValueError) as e:
+                        logger.warning(f"Summary of {resource_name} not migrated from {self.file_path}: {e}")
+                connection.executemany("INSERT OR IGNORE INTO summaries VALUES (?, ?, ?, ?)", rows)
+                connection.execute("INSERT INTO metadata VALUES ('json_migrated', ?)", (datetime.now().isoformat(),))
+                logger.info(f"{len(rows)} of {len(summaries)} summaries migrated from {self.file_path} "
+                            f"to {self.db_path}")
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
 
     def load_summary_file(self) -> dict:
         if os.path.exists(self.file_path):
@@ -16,30 +105,53 @@ class SummaryManager:
                 return json.load(file)
         return {}
 
-    def save_summary_file(self):
-        with open(self.file_path, 'w') as file:
-            json.dump(self.summary, file, indent=4)
+    @staticmethod
+    def normalize_date(resume_date: str) -> str:
+        return datetime.strptime(resume_date, "%Y-%m-%d").date().isoformat()
 
-    def get_summary(self, resource_key: str) -> str:
-        return self.summary[resource_key]['summary']
+    def _latest(self, resource_key: str) -> tuple:
+        row = self._connection().execute("SELECT resume_date, summary FROM summaries WHERE resource_name = ? "
+                                         "ORDER BY resume_date DESC LIMIT 1", (resource_key,)).fetchone()
+        if row is None:
+            raise KeyError(resource_key)
+        return row
+
+    def get_summary(self, resource_key: str, resume_date: str = None) -> str:
+        if resume_date is None:
+            return self._latest(resource_key)[1]
+        row = self._connection().execute("SELECT summary FROM summaries WHERE resource_name = ? AND resume_date = ?",
+                                         (resource_key, self.normalize_date(resume_date))).fetchone()
+        if row is None:
+            raise KeyError((resource_key, resume_date))
+        return row[0]
 
     def get_date(self, resource_key: str) -> str:
-        return self.summary[resource_key]['resume_date']
+        return self._latest(resource_key)[0]
 
     def check_keys(self, resource_name: str, resume_date: str) -> bool:
-        return True if (resource_name in self.summary and
-                        datetime.strptime(resume_date, "%Y-%m-%d").date() == datetime.strptime(self.summary[resource_name]['resume_date'], "%Y-%m-%d").date()) else False
-
-    def check_infos(self, cv: 'CVperson'):
-
-        if cv.get_resource_name() in self.summary:
-            if datetime.strptime(cv.get_resume_date(), "%Y-%m-%d").date() == datetime.strptime(self.summary[cv.get_resource_name()]['resume_date'], "%Y-%m-%d").date():
-                return True
-            else:
-                return False
-        return False
-
-    def save_summary(self, cv: 'CVperson', summary: str):
-        self.summary[cv.get_resource_name()] = {'resume_date': cv.get_resume_date(),
-                                                'summary': summary}
-        self.save_summary_file()
+        return self._connection().execute("SELECT 1 FROM summaries WHERE resource_name = ? AND resume_date = ?",
+                                          (resource_name, self.normalize_date(resume_date))).fetchone() is not None
+
+    def check_infos(self, cv: 'CVperson') -> bool:
+        return self.check_keys(resource_name=cv.get_resource_name(), resume_date=cv.get_resume_date())
+
+    def save_summary(self, cv: 'CVperson', summary: str) -> None:
+        self._connection().execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+                                   (cv.get_resource_name(), self.normalize_date(cv.get_resume_date()), summary,
+                                    datetime.now().isoformat()))
+
+
+def create_summary_manager(backend: str = None) -> 'SummaryManager':
+    """
+    Create the store of the summaries for the LLM backend selected by the LLM_BACKEND environment variable. The
+    summaries of the 'fake' backend are kept in their own database, so a load test never writes the summaries
+    served by /names/ with the real models.
+
+    :param backend: the LLM backend, default is the LLM_BACKEND environment variable
+
+    :return: the SummaryManager of the backend
+    """
+    backend = backend or os.getenv('LLM_BACKEND', 'openai')
+    if backend == 'fake':
+        return SummaryManager(file_name='llm_resources_summary_fake.json')
+    return SummaryManager(file_name='llm_resources_summary.json')
@@ -0,0 +1,201 @@
+from components.summarizer import SummaryManager
+from components.logger import logger
+from components.cv import CVperson
+from components.llm import LLM
+
+from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import random
+import time
+
+
+class TokenBucket:
+    """
+    A class to keep the calls to the LLM under a limit of tokens per minute.
+
+    ...
+
+    The bucket refills continuously at tokens_per_minute / 60 tokens per second up to one minute of tokens. Each call
+    takes its estimated tokens before starting, waiting if the bucket is empty, and the difference with the tokens
+    actually used is settled when the response arrives.
+
+    Attributes
+    ----------
+    tokens_per_minute : int
+        the maximum number of tokens per minute
+    tokens : float
+        the tokens currently available, negative when the calls used more tokens than estimated
+
+    Methods
+    -------
+    acquire(tokens: int) -> None:
+        Waits until the tokens are available and takes them.
+    settle(estimated: int, used: int) -> None:
+        Corrects the bucket with the tokens actually used by a call.
+    """
+    def __init__(self, tokens_per_minute: int):
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.tokens_per_minute, self.tokens + (now - self._updated) * self.tokens_per_minute / 60)
+        self._updated = now
+
+    def acquire(self, tokens: int) -> None:
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) * 60 / self.tokens_per_minute
+            time.sleep(wait)
+
+    def settle(self, estimated: int, used: int) -> None:
+        with self._lock:
+            self._refill()
+            self.tokens -= used - estimated
+
+
+class SummaryJob:
+    """
+    A class to generate in advance the LLM summaries of the CVs, so /names/ serves them without waiting on the LLM.
+
+    ...
+
+    The job selects the CVs whose summary is missing or older than the resume (SummaryManager.check_infos) and calls
+    the LLM concurrently, within a limit of parallel calls and of tokens per minute. The calls failing for rate
+    limits, timeouts or server errors are retried with exponential backoff. Each summary is saved as soon as it is
+    produced, so an interrupted job is resumed by running it again: the CVs already summarized are not selected
+    anymore.
+
+    Attributes
+    ----------
+    llm : LLM
+        the LLM model producing the summaries, without response cache so the token counters are the tokens paid
+    summary_manager : SummaryManager
+        the store of the summaries
+    concurrency : int
+        the maximum number of parallel calls to the LLM
+    max_retries : int
+        the maximum number of retries of a failed call
+    backoff : float
+        the seconds waited before the first retry, doubled at each retry
+    stats : dict
+        the counters of the job: selected, summarized, failed, retries, input and output tokens
+
+    Methods
+    -------
+    select(cvs: list[CVperson]) -> list[CVperson]:
+        Returns the CVs without an up-to-date summary.
+    run(cvs: list[CVperson], limit: int = None) -> dict:
+        Summarizes the selected CVs and returns the statistics of the job.
+    """
+    RETRYABLE = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+    def __init__(self, llm: 'LLM', summary_manager: 'SummaryManager', concurrency: int = 4,
+                 tokens_per_minute: int = 200000, max_retries: int = 5, backoff: float = 2.0,
+                 expected_output_tokens: int = 600):
+        self.llm = llm
+        self.summary_manager = summary_manager
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.expected_output_tokens = expected_output_tokens
+        self.bucket = TokenBucket(tokens_per_minute=tokens_per_minute)
+        self.stats = self._new_stats()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _new_stats() -> dict:
+        return {'selected': 0, 'summarized': 0, 'failed': 0, 'retries': 0, 'input_tokens': 0, 'output_tokens': 0}
+
+    def select(self, cvs: list['CVperson']) -> list['CVperson']:
+        selected = []
+        for cv in cvs:
+            try:
+                if not self.summary_manager.check_infos(cv=cv):
+                    selected.append(cv)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"CV {cv.get_idx()} skipped, resume date not valid: {e}")
+        return selected
+
+    def _estimate_tokens(self, cv: 'CVperson') -> int:
+        return len(self.llm.get_message(cv=cv)) // 4 + self.expected_output_tokens
+
+    def summarize(self, cv: 'CVperson') -> bool:
+        """
+        Produce the summary of one CV, retrying the transient errors with exponential backoff.
+
+        :param cv: the CV object to summarize
+
+        :return: True if the summary has been produced and saved, False on an empty answer or a storage error
+        """
+        for attempt in range(self.max_retries + 1):
+            estimated = self._estimate_tokens(cv)
+            self.bucket.acquire(estimated)
+            try:
+                summary, input_tokens, output_tokens = self.llm.get_answer(cv)
+            except self.RETRYABLE as e:
+                self.bucket.settle(estimated=estimated, used=0)
+                if attempt == self.max_retries:
+                    logger.error(f"Summary of {cv.get_resource_name()} failed after {attempt + 1} attempts: {e}")
+                    return False
+                delay = min(self.backoff * 2 ** attempt, 60) + random.uniform(0, 1)
+                logger.warning(f"Summary of {cv.get_resource_name()} retried in {delay:.1f}s: {e}")
+                with self._lock:
+                    self.stats['retries'] += 1
+                time.sleep(delay)
+                continue
+            except Exception as e:
+                logger.error(f"Summary of {cv.get_resource_name()} failed: {e}")
+                return False
+
+            self.bucket.settle(estimated=estimated, used=input_tokens + output_tokens)
+            with self._lock:
+                self.stats['input_tokens'] += input_tokens
+                self.stats['output_tokens'] += output_tokens
+            if not summary or not summary.strip():
+                logger.error(f"Summary of {cv.get_resource_name()} failed: empty answer, not saved")
+                return False
+            try:
+                self.summary_manager.save_summary(cv=cv, summary=summary)
+            except Exception as e:
+                logger.error(f"Summary of {cv.get_resource_name()} failed to be saved: {e}")
+                return False
+            return True
+        return False
+
+    def run(self, cvs: list['CVperson'], limit: int = None) -> dict:
+        """
+        Summarize concurrently the CVs without an up-to-date summary.
+
+        :param cvs: the list of CV objects of the archive
+        :param limit: the maximum number of CVs to summarize [optional]
+
+        :return: dictionary with the statistics of the job
+        """
+        start_time = time.time()
+        self.stats = self._new_stats()
+        selected = self.select(cvs)[:limit]
+        self.stats['selected'] = len(selected)
+        logger.info(f"Summary job started for {len(selected)} CVs out of {len(cvs)}, "
+                    f"{self.concurrency} parallel calls and {self.bucket.tokens_per_minute} tokens per minute")
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self.summarize, cv) for cv in selected]
+            for done, future in enumerate(as_completed(futures), start=1):
+                self.stats['summarized' if future.result() else 'failed'] += 1
+                if done % 50 == 0:
+                    logger.info(f"Summary job progress: {done}/{len(selected)} {self.get_stats()}")
+        self.stats['elapsed'] = round(time.time() - start_time, 2)
+        logger.info(f"Summary job completed: {self.get_stats()}")
+        return self.get_stats()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'total_tokens': self.stats['input_tokens'] + self.stats['output_tokens']}
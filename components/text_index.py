@@ -0,0 +1,132 @@
+from components.fragments import FragmentMatrix
+from components.matcher import KeywordMatcher
+from components.logger import logger
+
+import numpy as np
+import time
+
+
+class TextIndex:
+    """
+    A class to represent an inverted index of character n-grams over the lowercased bodies of the CVs.
+
+    ...
+
+    Each n-gram points to the sorted positions of the CVs containing it. A keyword can be in a body only if all its
+    n-grams are, so the postings of the keyword n-grams are intersected to get the candidate CVs and only the
+    candidates are checked with the same `in` test of CVperson.find_in_text, which gives the same 0/1 results
+    without scanning every body. As in the FragmentMatrix the CVs are grouped by business line and the postings are
+    partitioned by shard, so a filtered search only reads the postings and the bodies of its business lines.
+
+    Attributes
+    ----------
+    ids : list[str]
+        the resource codes of the CVs, in the order of the positions
+    bodies : list[str]
+        the lowercased bodies of the CVs
+    n : int
+        the length of the n-grams
+    shards : dict[str, list[tuple[int, int]]]
+        the ranges of CVs (positions in ids) of each business line
+    postings : dict[str, dict[str, np.ndarray]]
+        for each business line, the sorted positions of its CVs containing each n-gram
+
+    Methods
+    -------
+    from_cvs(cvs: list[CVperson], n: int = 3) -> TextIndex:
+        Builds the index from a list of CV objects, grouped by business line.
+    get_ids(business_lines: list[str] = None) -> list[str]:
+        Returns the resource codes of the CVs of the business lines, all of them by default.
+    lookup(word: str, business_line: str) -> set[int]:
+        Returns the positions of the CVs of the business line containing the word.
+    match(words: list[str], business_lines: list[str] = None, matcher: KeywordMatcher = None) -> dict:
+        Returns the 0/1 presence, or the occurrences, of each word for each CV of the business lines.
+    """
+    def __init__(self, ids: list[str], bodies: list[str], business_lines: list[str] = None, n: int = 3):
+        start_time = time.time()
+        self.ids = ids
+        self.bodies = [body.lower() for body in bodies]
+        self.n = n
+        self.shards = FragmentMatrix._create_shards(business_lines if business_lines is not None else [None] * len(ids))
+
+        self.postings = {}
+        for business_line, cv_ranges in self.shards.items():
+            postings = {}
+            for start, end in cv_ranges:
+                for position in range(start, end):
+                    body = self.bodies[position]
+                    for gram in {body[i:i + n] for i in range(len(body) - n + 1)}:
+                        postings.setdefault(gram, []).append(position)
+            self.postings[business_line] = {gram: np.asarray(positions, dtype=np.int32)
+                                            for gram, positions in postings.items()}
+        logger.info(f"Text index built with {sum(len(postings) for postings in self.postings.values())} {n}-grams "
+                    f"in {len(self.shards)} shards for {len(ids)} CVs in {time.time() - start_time:.2f}s")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_cvs(cls, cvs: list['CVperson'], n: int = 3) -> 'TextIndex':
+        cvs = sorted(cvs, key=FragmentMatrix.shard_key)
+        return cls(ids=[cv.get_idx() for cv in cvs], bodies=[cv.get_body() for cv in cvs],
+                   business_lines=[cv.person.get_coe() for cv in cvs], n=n)
+
+    def _select(self, business_lines: list[str] = None) -> list[str]:
+        if business_lines is None:
+            return list(self.shards)
+        return [bl for bl in dict.fromkeys(business_lines) if bl in self.shards]
+
+    def get_ids(self, business_lines: list[str] = None) -> list[str]:
+        return [self.ids[position] for bl in self._select(business_lines)
+                for start, end in self.shards[bl] for position in range(start, end)]
+
+    def lookup(self, word: str, business_line: str) -> set[int]:
+        """
+        Find the CVs of a business line containing the word, with the same case-insensitive substring test of
+        CVperson.find_in_text.
+
+        :param word: the word to search for
+        :param business_line: the business line of the shard where to search
+
+        :return: the set of the positions of the CVs containing the word
+        """
+        word = word.lower()
+        if len(word) < self.n:
+            return {position for start, end in self.shards[business_line] for position in range(start, end)
+                    if word in self.bodies[position]}
+
+        shard_postings = self.postings[business_line]
+        grams = {word[i:i + self.n] for i in range(len(word) - self.n + 1)}
+        if any(gram not in shard_postings for gram in grams):
+            return set()
+        postings = sorted((shard_postings[gram] for gram in grams), key=len)
+        candidates = postings[0]
+        for positions in postings[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = np.intersect1d(candidates, positions, assume_unique=True)
+        return {position for position in candidates.tolist() if word in self.bodies[position]}
+
+    def match(self, words: list[str], business_lines: list[str] = None,
+              matcher: 'KeywordMatcher' = None) -> dict[str, dict[str, int]]:
+        """
+        Check the presence of each word in each CV of the selected shards. When a matcher is given, the CVs
+        containing at least one word are scanned once by the matcher to count the occurrences of the words.
+
+        :param words: list of words to look-up in the CVs
+        :param business_lines: the business lines of the shards to search, default is the whole collection
+        :param matcher: the KeywordMatcher of the words, to return the occurrences instead of the presence
+
+        :return: dictionary {resource_code: {word: 1 or 0}} with the presence, or the occurrences, of the words
+        """
+        results = {}
+        for business_line in self._select(business_lines):
+            hits = {word: self.lookup(word, business_line) for word in words}
+            for start, end in self.shards[business_line]:
+                for position in range(start, end):
+                    idx = self.ids[position]
+                    results[idx] = {word: 1 if position in hits[word] else 0 for word in words}
+                    if matcher is not None and any(results[idx].values()):
+                        counts = matcher.find(self.bodies[position])
+                        results[idx] = {word: counts.get(word, 0) for word in words}
+        return results
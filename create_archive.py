@@ -20,6 +20,7 @@ if __name__ == '__main__':
     db.connect()
 
     create_obj(sql_manager=db,
-               cvs_collector=CVS())
+               cvs_collector=CVS(),
+               incremental=True)
 
     logger.info(f"Archive created and saved to 'archive_{today.strftime("%d_%m_%Y")}.pkl'")
@@ -122,7 +122,7 @@ def add_skills(input_type: str) -> None:
 def execute_ranking():
     try:
         ranking = requests.get(url=f"{config.API_URL}/keywords/",
-                               json={'list_skills': st.session_state['data_skill']}).json()
+                               json={'list_skills': st.session_state['data_skill'], 'k': config.N_ROWS}).json()
         # st.session_state['results_semantic'] = pd.DataFrame(ranking).transpose()
         st.session_state['results_semantic'] = ranking
         st.session_state.feedback_cont = True
@@ -207,7 +207,7 @@ if st.session_state['results_semantic'] is not None:
     if st.session_state['pwd'] == config.DOWNLOAD_PWD:
         try:
             df = st.session_state["results_semantic"]
-            formatted = format_results(df)
+            formatted = format_results(df, with_body=True)
             excel_data = convert_df_to_excel(formatted)
             st.download_button(
                 label="Download Results",
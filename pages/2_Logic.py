@@ -63,7 +63,7 @@ def execute_search():
     try:
         # st.session_state['skills_logic'] = df
         ranking = requests.get(f'{config.API_URL}/logic/',
-                               json={'list_skills': st.session_state['skills_logic']}).json()
+                               json={'list_skills': st.session_state['skills_logic'], 'threshold': 1}).json()
         st.session_state['results_logic'] = format_logic(res=ranking)
         st.session_state.feedback_cont = True
     except requests.exceptions.ConnectionError:
@@ -98,7 +98,7 @@ if st.session_state['results_onto'] is not None:
     st.markdown(f"### Results for {st.session_state['coe_onto']}")
     st.dataframe(format_results(st.session_state['results_onto']))
     if st.session_state['pwd'] == config.DOWNLOAD_PWD:
-        st.download_button(label="Download Results", data=convert_df_to_excel(format_results(st.session_state['results_onto'])),
+        st.download_button(label="Download Results", data=convert_df_to_excel(format_results(st.session_state['results_onto'], with_body=True)),
                            file_name=f"Results_{st.session_state['time'].format('YYYY-MM-DD HH:mm:ss')}.xlsx",
                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
@@ -4,6 +4,7 @@ import requests.exceptions
 import streamlit as st
 import requests
 import arrow
+import json
 
 
 st.set_page_config(page_title="Summary", page_icon="📈")
@@ -54,14 +55,16 @@ def btn_del():
 
 
 def btn_search():
-    try:
-        if st.session_state['names'] is not None:
-            st.session_state['summary'] = requests.get(f"{config.API_URL}/names/",
-                                                       json={'name': st.session_state['names']}).json()
-    except requests.exceptions.ConnectionError:
-        st.error(f"Connection Error")
-        st.warning("try again to connect")
-        st.button("Check Connection", on_click=btn_search)
+    if st.session_state['names'] is not None:
+        st.session_state['stream_summary'] = True
+
+
+def stream_summary(name: str):
+    with requests.get(f"{config.API_URL}/names/stream/", json={'name': name}, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith('data: '):
+                yield json.loads(line[len('data: '):])['token']
 
 
 ########################################################################################################################
@@ -81,7 +84,20 @@ except TypeError:
     st.error("Loading information Failed")
 
 
-if 'summary' in st.session_state:
+if st.session_state.get('stream_summary'):
+    st.session_state['stream_summary'] = False
+    container_text = st.container(border=True)
+    container_text.markdown(f"#### {st.session_state.names}'s CV")
+    try:
+        st.session_state['summary'] = {'answer': container_text.write_stream(stream_summary(st.session_state.names))}
+    except requests.exceptions.ConnectionError:
+        st.error(f"Connection Error")
+        st.warning("try again to connect")
+        st.button("Check Connection", on_click=btn_search)
+    except requests.exceptions.RequestException as e:
+        st.error(f"Summary not available: {e}")
+        st.button("Try again", on_click=btn_search)
+elif 'summary' in st.session_state:
     container_text = st.container(border=True)
     container_text.markdown(f"#### {st.session_state.names if 'names' in st.session_state else st.session_state.ids}'s CV")
     container_text.markdown(st.session_state.summary['answer'])
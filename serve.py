@@ -0,0 +1,49 @@
+from components.logger import logger
+from components.cvs import CVS
+
+import multiprocessing
+import numpy as np
+import argparse
+import uvicorn
+import time
+import os
+
+
+def prepare() -> None:
+    """
+    Pre-fork loader: write the columnar archive of the most recent CVs, if it is missing or older than the pickle,
+    and read its fragment matrix once, so the workers open the memory-mapped files already in the OS page cache and
+    share the same pages instead of unpickling a private copy of the archive each.
+
+    :return: nothing
+    """
+    start_time = time.time()
+    cvs = CVS()
+    cvs.load(build_columnar=True)
+    matrix = cvs.get_fragment_matrix().matrix
+    for start in range(0, matrix.shape[0], 65536):
+        np.asarray(matrix[start:start + 65536]).max()
+    logger.info(f"Archive {cvs.archive_name} prepared for the workers with {len(cvs)} CVs and {matrix.shape[0]} "
+                f"fragments in {time.time() - start_time:.2f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the CV API with several worker processes")
+    parser.add_argument('--host', default=os.getenv('API_HOST', '10.1.2.97'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('API_PORT', 8001)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('API_WORKERS', 2)))
+    args = parser.parse_args()
+
+    # the archive is prepared in a child process, so the supervisor does not keep the CVs in memory
+    loader = multiprocessing.get_context('spawn').Process(target=prepare)
+    loader.start()
+    loader.join()
+    if loader.exitcode != 0:
+        raise SystemExit(f"Archive preparation failed with exit code {loader.exitcode}")
+
+    # each worker loads its own copy of the model, so the CPU threads are split among the workers
+    os.environ.setdefault('TORCH_NUM_THREADS', str(max(1, (os.cpu_count() or 1) // args.workers)))
+    # the columnar archive is written only by the loader, the workers open it read-only
+    os.environ['ARCHIVE_BUILD_COLUMNAR'] = '0'
+    logger.info(f"Starting {args.workers} workers on {args.host}:{args.port}")
+    uvicorn.run("api_cv:app", host=args.host, port=args.port, workers=args.workers)
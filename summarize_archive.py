@@ -0,0 +1,31 @@
+from components.summarizer import create_summary_manager
+from components.summary_job import SummaryJob
+from components.logger import logger
+from components.llm import create_llm
+from components.cvs import CVS
+
+import argparse
+import json
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate in advance the LLM summaries of the CVs of the archive")
+    parser.add_argument('--model', default='gpt-4o-mini')
+    parser.add_argument('--backend', choices=['openai', 'local', 'fake'], default=None)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--tokens-per-minute', type=int, default=200000)
+    parser.add_argument('--max-retries', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+
+    cvs = CVS()
+    cvs.load()
+
+    # the job calls the LLM without the response cache, so its token counters match the rate limit accounting
+    job = SummaryJob(llm=create_llm(model=args.model, backend=args.backend, cache=None),
+                     summary_manager=create_summary_manager(backend=args.backend),
+                     concurrency=args.concurrency,
+                     tokens_per_minute=args.tokens_per_minute,
+                     max_retries=args.max_retries)
+    stats = job.run(cvs.get_cvs(), limit=args.limit)
+    logger.info(f"Summaries of {cvs.archive_name} generated: {json.dumps(stats, indent=4)}")
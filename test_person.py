@@ -1,4 +1,6 @@
 from components.sql_connector import SQLManager
+from components.ingestion import CVIngestor
+from components.archive import ArchiveWriter
 # from components.logger import logger
 from components.cv import CVperson
 from components.cvs import CVS
@@ -9,19 +11,40 @@ from tqdm import tqdm
 
 today = datetime.now()
 
-def create_obj(sql_manager: 'SQLManager', cvs_collector: 'CVS') -> None:
+def create_obj(sql_manager: 'SQLManager', cvs_collector: 'CVS', chunk_size: int = 256,
+               incremental: bool = False) -> None:
     cv_dicts = sql_manager.execute()
-    pbar = tqdm(total=len(cv_dicts), desc='Processing CVs', ascii=True)
-    for key, value in cv_dicts.items():
-        try:
-            cv = CVperson.read_from_dict(idx=key, cv_dict=value)
+    ingestor = CVIngestor()
+    writer = ArchiveWriter(name=f'archive_{today.strftime("%d_%m_%Y")}')
+    for cv in writer.resume():
+        if cv.get_idx() in cv_dicts:
             cvs_collector.add_cv(cv)
-            cvs_collector.save(name=f'archive_{today.strftime("%d_%m_%Y")}',
-                               pkl_file=True, json_file=False)
-        except TypeError as e:
-            print(f"TypeError for key {key}: {e}")
-        pbar.update(1)
+    resumed = set(cvs_collector.by_idx)
+
+    if incremental and CVS._search_most_recent() is not None:
+        previous = CVS()
+        previous.load()
+        reused, cv_dicts = ingestor.diff(previous=previous, cv_dicts=cv_dicts)
+        for cv in reused:
+            if cv.get_idx() not in resumed:
+                cvs_collector.add_cv(cv)
+                writer.append(cv)
+
+    keys = [key for key in cv_dicts.keys() if key not in resumed]
+    pbar = tqdm(total=len(keys), desc='Processing CVs', ascii=True)
+    for start in range(0, len(keys), chunk_size):
+        chunk = {key: cv_dicts[key] for key in keys[start:start + chunk_size]}
+        for cv in ingestor.ingest(chunk):
+            cvs_collector.add_cv(cv)
+            writer.append(cv)
+        writer.flush()
+        pbar.update(len(chunk))
     pbar.close()
+    # the columnar archive is written first: the API reloads it only once it is complete, and the pickle name
+    # marks the whole build as finished
+    cvs_collector.save_columnar(filename=writer.name, replace=True)
+    writer.finalize(cvs_collector.get_cvs())
+    ingestor.report()
 
 
 # if __name__ == '__main__':